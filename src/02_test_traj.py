@@ -17,15 +17,14 @@ import d2d.trajectory_factory as ddtf
 def display_trajectory(traj, show_Yref=True, show_Xref=True, show_2d=True):
     t0, t1, dt = 0, traj.duration, 0.01
     time = np.arange(t0, t1, dt)
-    Yref = np.array([traj.get(t) for t in time])
+    Yref = traj.get_batch(time)
     Xref = None
     if show_Yref:
         d2plot.plot_flat_output_trajectory_chrono(time, Yref)
     if show_Xref:
         aircraft, windfield = ddd.Aircraft(), dg.WindField()#[5., 0])
-        Wref = np.array([windfield.sample(_t, _l) for _t, _l in zip(time, Yref[:,0,:])])
-        XUref = [dg.DiffFlatness.state_and_input_from_output(Y, W, aircraft)  for Y,W in zip(Yref, Wref)]
-        Xref, Uref = np.array([_Xu[0] for _Xu in XUref]), [_Xu[1] for _Xu in XUref]
+        Wref = windfield.sample(time, Yref[:,0,0], Yref[:,0,1])
+        Xref, Uref, Xrefdot = dg.DiffFlatness.state_and_input_from_outputs(Yref, Wref, aircraft)
         d2plot.plot_trajectory_chrono(time, X=None, U=None, Xref=Xref, _f=None, _a=None)
     if show_2d:
         d2plot.plot_trajectory_2d(time, X=None, U=None, Yref=Yref, Xref=Xref)
@@ -36,10 +35,10 @@ def display_animation(traj):
     t0, t1, dt = 0, traj.duration, 0.01
     time = np.arange(t0, t1, dt)
 
-    Yref = np.array([traj.get(t) for t in time])
+    Yref = traj.get_batch(time)
     Yrefs = [Yref]
     windfield = dg.WindField([0, 0])
-    Wref = np.array([windfield.sample(_t, _l) for _t, _l in zip(time, Yref[:,0,:])])
+    Wref = windfield.sample(time, Yref[:,0,0], Yref[:,0,1])
     X, U, Xref = None, None, None
     anim = dda.animate(time, X, U, Yrefs, Xref, title=f'trajectory: {traj.name}', extends=traj.extends)
     return anim
@@ -17,22 +17,21 @@ from d2d.dynamic import Aircraft
 def test_scenario(scen, show_Yref, show_Xref, show_anim, show_2d):
     Yrefs = []
     for trj in scen.trajs:
-        Yrefs.append(np.array([trj.get(t) for t in scen.time]))
+        Yrefs.append(trj.get_batch(scen.time))
     if show_Yref:
         _f, _a = None, None
         for i, Yref in enumerate(Yrefs):
             _f, _a = d2plot.plot_flat_output_trajectory_chrono(scen.time, Yref, _f, _a, f'ref_{i}') 
 
     Wrefs, Xrefs, Urefs = [], [], []
-    ac = Aircraft() # FIXME, needs per Yref instance
     if show_Xref:
         _f, _a = None, None
-        for Yref in Yrefs:
-            Wref = np.array([scen.windfield.sample(_t, _l) for _t, _l in zip(scen.time, Yref[:,0,:])])
+        for Yref, ac in zip(Yrefs, scen.aircrafts):
+            Wref = scen.windfield.sample(scen.time, Yref[:,0,0], Yref[:,0,1])
             Wrefs.append(Wref)
-            XUref = [dg.DiffFlatness.state_and_input_from_output(Y, W, ac)  for Y,W in zip(Yref, Wref)]
-            Xref, Uref = np.array([_Xu[0] for _Xu in XUref]), [_Xu[1] for _Xu in XUref]
-            Xrefdot = np.array([_Xu[2] for _Xu in XUref])
+            # with the wind rates along the reference, as flown by the controller
+            Wdot = dg.wind_rates(scen.windfield, scen.time, Yref)
+            Xref, Uref, Xrefdot = dg.DiffFlatness.state_and_input_from_outputs(Yref, Wref, ac, Wdot)
             _f, _a = d2plot.plot_trajectory_chrono(scen.time, X=None, U=None, Xref=Xref, _f=_f, _a=_a)
             if 0: # check vadot: yes
                 _a[2,1].plot(scen.time, Xrefdot[:, Aircraft.s_va], label='df')
@@ -1,7 +1,7 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse
+import argparse, os
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -13,36 +13,55 @@ import d2d.animation as dda
 import d2d.trajectory as ddt
 import d2d.trajectory_factory as ddtf
 import d2d.scenario as dds
+import d2d.recorder as d2rec
+import d2d.sim_cache as d2cache
+import d2d.wind as d2w
 
-#
-# Dynamic Simulation
-#
-   
-def run_simulation(time, aircraft, windfield, ctl, X0, perts):
-    X,U = np.zeros((len(time), ddyn.Aircraft.s_size)), np.zeros((len(time), ddyn.Aircraft.i_size))
-    Yref = np.array([ctl.traj.get(t) for t in time])
-    X[0] = X0
-    for i in range(1, len(time)):
-        U[i-1] = ctl.get(X[i-1], time[i-1])#, time)
-        X[i] = aircraft.disc_dyn(X[i-1], U[i-1], windfield, time[i-1], time[i]-time[i-1])
-        X[i] += perts[i]
-    U[-1] = ctl.get(X[-1], time[-1])
-    return X, U, Yref
+from d2d.simulation import run_simulation, run_fleet_simulation, run_simulation_adaptive, run_simulation_streamed
+from d2d.simulation import run_multirate_simulation, hold_records
 
-def test_simulation(scen, show_chrono, show_2d, show_anim, show_extra, save):
+def test_simulation(scen, show_chrono, show_2d, show_anim, show_extra, save, fleet=False, integrator='odeint', substeps=1, adaptive=False, ctl_dt=0.1,
+                    stream=None, multirate=False, cache=None):
     windfield = scen.windfield
     aircrafts = [ddyn.Aircraft() for i in range(len(scen.trajs))]
+    record = stream is None # when streaming, controllers don't keep history
     if scen.ppctl:
-        ctls = [ddg.PurePursuitControler(traj) for traj in scen.trajs]
+        ctls = [ddg.PurePursuitControler(traj, record) for traj in scen.trajs]
     else:
-        ctls = [ddg.DFFFController(traj, ac, windfield) for traj, ac in zip(scen.trajs, aircrafts)]
+        ctls = [ddg.DFFFController(traj, ac, windfield, record) for traj, ac in zip(scen.trajs, aircrafts)]
     #np.set_printoptions(precision=2, linewidth=600)
     print(f"control: {'ppctl' if scen.ppctl else 'dfctl'}")
    
-    Xs, Us, Yrefs = [], [], []
-    for traj, aircraft, X0, ctl, pert in zip(scen.trajs, aircrafts, scen.X0s, ctls, scen.perts):
-        X, U, Yref = run_simulation(scen.time, aircraft, windfield, ctl, X0, pert)
-        Xs.append(X); Us.append(U); Yrefs.append(Yref)
+    if fleet: # all aircraft integrated together
+        Xs, Us, Yrefs = run_fleet_simulation(scen.time, ddyn.Fleet(aircrafts), windfield, ctls, scen.X0s, scen.perts, integrator, substeps)
+        X, U, Yref = Xs[-1], Us[-1], Yrefs[-1]
+    elif stream is not None: # results go to disk and are read back lazily
+        Xs, Us, Yrefs, Xrefs = [], [], [], []
+        for i, (aircraft, X0, ctl, pert) in enumerate(zip(aircrafts, scen.X0s, ctls, scen.perts.split(len(ctls)))):
+            _dir = os.path.join(stream, f'aircraft_{i}')
+            with d2rec.ChunkedWriter(_dir) as writer:
+                run_simulation_streamed(scen.time, aircraft, d2w.for_aircraft(windfield, i), ctl, X0, pert, writer, integrator, substeps)
+            run = d2rec.load(_dir)
+            print(f'streamed aircraft {i} to {_dir}')
+            Xs.append(run['X']); Us.append(run['U']); Yrefs.append(run['Yref']); Xrefs.append(run['Xref'])
+        X, U, Yref = Xs[-1], Us[-1], Yrefs[-1]
+    elif cache is not None: # only the aircraft whose inputs changed are simulated
+        sim_cache = d2cache.SimCache(cache)
+        Xs, Us, Yrefs = sim_cache.simulate_scenario(scen, ctls, integrator, substeps, aircrafts)
+        print(sim_cache.summarize())
+        X, U, Yref = Xs[-1], Us[-1], Yrefs[-1]
+    else:
+        Xs, Us, Yrefs = [], [], []
+        for i, (aircraft, X0, ctl, pert) in enumerate(zip(aircrafts, scen.X0s, ctls, scen.perts.split(len(ctls)))):
+            windfield = d2w.for_aircraft(scen.windfield, i) # the plant gets the aircraft gusts, controllers the mean wind
+            if adaptive:
+                X, U, Yref = run_simulation_adaptive(scen.time, aircraft, windfield, ctl, X0, pert, ctl_dt)
+            elif multirate:
+                X, U, Yref = run_multirate_simulation(scen.time, aircraft, windfield, ctl, X0, pert, ctl_dt,
+                                                      integrator=integrator, substeps=substeps)
+            else:
+                X, U, Yref = run_simulation(scen.time, aircraft, windfield, ctl, X0, pert, integrator, substeps)
+            Xs.append(X); Us.append(U); Yrefs.append(Yref)
         
     if show_2d:
         d2plot.plot_trajectory_2d(scen.time, X, U, Yref)
@@ -50,7 +69,8 @@ def test_simulation(scen, show_chrono, show_2d, show_anim, show_extra, save):
     if show_chrono:
         #ctls[0].draw_debug(_f, _a)
         d2plot.plot_trajectories_chrono(scen.time, Xs, Us, Yrefs)
-        Xr =  np.array(ctls[0].Xref)
+        # controllers may run slower than the simulation (adaptive, multirate): their references are held on scen.time
+        Xr =  Xrefs[-1] if stream is not None else hold_records(ctls[-1].t, ctls[-1].Xref, scen.time)
         d2plot.plot_control_chrono(scen.time, X=X, U=U, Yref=None, Xref=Xr)
         
     if show_anim:
@@ -59,7 +79,7 @@ def test_simulation(scen, show_chrono, show_2d, show_anim, show_extra, save):
         #dda.save_anim('/home/poine/tmp/foo.gif', anim, 0.01)
         if save:
             #dda.save_anim('/tmp/foo.apng', anim, 0.01)
-            dda.save_anim(save, anim, 0.01)
+            dda.save_anim(save, anim, scen.time[1]-scen.time[0])
         #dda.save_anim('/home/poine/tmp/foo.gif', anim, 0.01)
 
     else: anim=None
@@ -77,6 +97,17 @@ def parse_command_line():
     parser.add_argument('--Y', help='plot output', action='store_true', default=False)
     parser.add_argument('--list', help='list all available scenarios', action='store_true', default=False)
     parser.add_argument('--save', help='filename for saving plot', default=None)
+    parser.add_argument('--fleet', help='integrate all aircraft together', action='store_true', default=False)
+    parser.add_argument('--integrator', help=f'one of {ddyn.integrators}', default='odeint')
+    parser.add_argument('--substeps', help='substeps for fixed step integrators', type=int, default=1)
+    parser.add_argument('--adaptive', help='adaptive step integration between events', action='store_true', default=False)
+    parser.add_argument('--multirate', help='run the controller at its own rate (--ctl_dt)', action='store_true', default=False)
+    parser.add_argument('--ctl_dt', help='controller period (s) for the adaptive and multirate simulations', type=float, default=0.1)
+    parser.add_argument('--stream', help='directory where results are streamed', default=None)
+    parser.add_argument('--cache', help='simulation cache directory (ex: cache/sim)', default=None)
+    parser.add_argument('--dt', help='simulation time step (s), default to the scenario one', type=float, default=None)
+    parser.add_argument('--wind_log', help='replay a recorded wind log (.npy rows of t, wx, wy)', default=None)
+    parser.add_argument('--wind_log_offset', help='log time (s) at the start of the simulation', type=float, default=0.)
     args = parser.parse_args()
     return args
 
@@ -100,8 +131,13 @@ def main():
     except KeyError:
         print('unknown scenario {}'.format(args.scen))
         return
+    if args.dt is not None: scen.set_dt(args.dt)
+    if args.wind_log is not None: # initial states are kept
+        scen.windfield = d2w.LoggedWindField(args.wind_log, args.wind_log_offset)
+        print(f'wind: {scen.windfield.summarize()}')
     show_extra = False
-    anim = test_simulation(scen, args.X, args.twod, args.anim, show_extra, args.save)
+    anim = test_simulation(scen, args.X, args.twod, args.anim, show_extra, args.save, args.fleet, args.integrator, args.substeps,
+                           args.adaptive, args.ctl_dt, args.stream, args.multirate, args.cache)
     plt.show()
     
 if __name__ == "__main__":
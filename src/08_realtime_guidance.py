@@ -17,6 +17,7 @@ import d2d.opty_planner as d2op
 
 import d2d.guidance as d2guid
 import d2d.dynamic as d2dyn
+import d2d.recorder as d2rec
 
 import d2d.ploting as d2plot
 
@@ -150,6 +151,7 @@ class Controller:
         self.backend.jump_to_block_name(self.ac_id, fallback_block_name)
         self.backend.publish_track(self.traj, 0., delete=True)
         self.backend.shutdown()
+        if self.initialized: self.ctl.recorder.close()
 
     def step(self, t):
         try:
@@ -160,11 +162,13 @@ class Controller:
             # Trajectory and control initialization
             print(f'Computing trajectory at {x}, {y}, {psi}, {phi}, {v}')
             self.traj = get_trajectory(self.traj_id, x, y, psi, phi, v)
+            # bounded history, older records are spilled to disk when rec_spill is set
+            rec = d2rec.RingRecorder(self.conf['rec_depth'], np.float32, spill=self.conf['rec_spill'])
             if self.ctl_id == 0:
-                self.ctl = d2guid.PurePursuitControler(self.traj)
+                self.ctl = d2guid.PurePursuitControler(self.traj, record=rec)
             else:
                 ac , wind = d2dyn.Aircraft(), d2guid.WindField([0., 0.])
-                self.ctl = d2guid.DFFFController(self.traj, ac, wind)
+                self.ctl = d2guid.DFFFController(self.traj, ac, wind, record=rec, scheduled=self.ctl_id==2, tvlqr=self.ctl_id==3)
             ext_guid_block_name = "Ext Guidance"
             self.backend.jump_to_block_name(self.ac_id, ext_guid_block_name)
             self.initialized = True
@@ -184,7 +188,7 @@ def plot_pprz_debug(ctl):
     plt.plot(ts, Xs[:,0], '.')
             
 def plot(ctl):
-    t, X, Xr, U = np.array(ctl.ctl.t), np.array(ctl.ctl.X), np.array(ctl.ctl.Xref), np.array(ctl.ctl.U)#, np.array(ctl.ctl.Yr)
+    t, X, Xr, U = [ctl.ctl.records(k) for k in ['t', 'X', 'Xref', 'U']]
     d2plot.plot_trajectory_chrono(t, X)
     d2plot.plot_control_chrono(t, X=X, U=U, Yref=None, Xref=Xr)
     ctl.ctl.draw_debug()
@@ -196,8 +200,8 @@ def main(args):
     #     conf = json.load(f)
     #     if args.verbose:
     #         print(json.dumps(conf))
-    conf = {'hz':10}
-    ctl_id = 1
+    conf = {'hz':10, 'rec_depth':4096, 'rec_spill':args.rec_spill}
+    ctl_id = int(args.ctl)
     traj_id = int(args.traj)
     c = Controller(conf, traj_id, ctl_id)
     c.run()
@@ -211,5 +215,7 @@ if __name__ == '__main__':
     parser.add_argument('-v', '--verbose', dest='verbose', default=False, action='store_true', help="display debug messages")
     parser.add_argument('--traj', help='trajectory index', default=0)
     parser.add_argument('--plot', help='trajectory index', default=False)
+    parser.add_argument('--ctl', help='controller: 0 pure pursuit, 1 dfff, 2 dfff with scheduled gains, 3 dfff with time varying lqr', default=1)
+    parser.add_argument('--rec_spill', help='directory where the records of long sessions are spilled', default=None)
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,64 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import matplotlib.pyplot as plt
+
+import d2d.dynamic as ddyn
+import d2d.scenario as dds
+import d2d.montecarlo as dmc
+import d2d.sensors as dsens
+
+#
+# Monte Carlo robustness evaluation of the DFFF controller on a scenario
+#
+
+def plot_results(res, scen):
+    _f = plt.figure(tight_layout=True, figsize=[16., 5.])
+    _a = _f.subplots(1, 4)
+    for _ax, (name, v) in zip(_a, [('mean error (m)', res.err_mean), ('max error (m)', res.err_max),
+                                   ('final error (m)', res.err_final), ('saturation (s)', res.sat_time)]):
+        _ax.hist(v.ravel(), bins=50)
+        _ax.set_title(name)
+    _f.suptitle(f'Monte Carlo (scen {scen.name}, {res.err_mean.shape[0]} runs)')
+
+
+def parse_command_line():
+    parser = argparse.ArgumentParser(description='Runs a Monte Carlo evaluation of the DFFF controller.')
+    parser.add_argument('--scen', help='the name of the scenario', default=None)
+    parser.add_argument('--list', help='list all available scenarios', action='store_true', default=False)
+    parser.add_argument('--runs', help='number of runs (each one flies every aircraft of the scenario)', type=int, default=100)
+    parser.add_argument('--seed', help='random seed', type=int, default=0)
+    parser.add_argument('--sig_w', help='standard deviation of the per run wind offset to the scenario field (m/s)', type=float, default=2.)
+    parser.add_argument('--sig_turb', help='dryden turbulence intensity (m/s)', type=float, default=0.)
+    parser.add_argument('--n_perts', help='number of random perturbations per aircraft', type=int, default=1)
+    parser.add_argument('--integrator', help=f'one of {ddyn.integrators}', default='zoh')
+    parser.add_argument('--dt', help='simulation time step (s), default to the scenario one', type=float, default=None)
+    parser.add_argument('--gain_period', help='LQR gains update period (s), default to every step', type=float, default=None)
+    parser.add_argument('--datalink', help='control from emulated telemetry instead of true states', action='store_true', default=False)
+    parser.add_argument('--telemetry', help='paparazzi telemetry xml file for the message periods', default=None)
+    parser.add_argument('--plot', help='plot metrics histograms', action='store_true', default=False)
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line()
+    if args.list or not args.scen:
+        dds.print_available()
+        return
+    scen, desc = dds.get(args.scen)
+    print(f'loading scenario: {args.scen}\n  description: {desc}')
+    if args.dt is not None: scen.set_dt(args.dt)
+    mc = dmc.MonteCarlo(scen, args.runs, args.seed, sig_w=args.sig_w, n_perts=args.n_perts, sig_turb=args.sig_turb)
+    datalink = None
+    if args.datalink:
+        datalink = dsens.Datalink(args.runs*len(scen.trajs), dsens.telemetry_periods(args.telemetry), seed=args.seed)
+    res = mc.run(args.integrator, gain_period=args.gain_period, datalink=datalink)
+    print(res.summarize())
+    if datalink is not None: print(datalink.summarize())
+    if args.plot:
+        plot_results(res, scen)
+        plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+
+import d2d.dynamic as ddyn
+import d2d.scenario as dds
+import d2d.sweep as dsw
+
+#
+# Headless sweep over scenarios, winds, controllers and time steps
+#
+# ex: ./11_sweep.py --scens line,circle --winds "0,0;2,0;0,-3" --ctls dfff,pp --dts 0.01,0.05 --out /tmp/sweep
+#
+
+def parse_command_line():
+    parser = argparse.ArgumentParser(description='Runs a sweep of simulations across a process pool.')
+    parser.add_argument('--scens', help='comma separated scenario names, or all', default='all')
+    parser.add_argument('--winds', help='semicolon separated wind vectors, default to the scenario one', default=None)
+    parser.add_argument('--ctls', help='comma separated controllers among dfff, pp and scen', default='scen')
+    parser.add_argument('--dts', help='comma separated time steps, default to the scenario one', default=None)
+    parser.add_argument('--integrator', help=f'one of {ddyn.integrators}', default='odeint')
+    parser.add_argument('--substeps', help='substeps for fixed step integrators', type=int, default=1)
+    parser.add_argument('--workers', help='number of processes, default to the number of cpus', type=int, default=None)
+    parser.add_argument('--timeout', help='per job timeout (s)', type=float, default=None)
+    parser.add_argument('--out', help='output filename, without extension', default=None)
+    parser.add_argument('--keep_states', help='save the state trajectories', action='store_true', default=False)
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line()
+    scens = sorted(dds._scenarios) if args.scens == 'all' else args.scens.split(',')
+    winds = [None] if args.winds is None else [[float(_c) for _c in _w.split(',')] for _w in args.winds.split(';')]
+    dts = [None] if args.dts is None else [float(_dt) for _dt in args.dts.split(',')]
+    jobs = dsw.make_jobs(scens, winds, args.ctls.split(','), dts, args.integrator, args.substeps)
+    print(f'{len(jobs)} jobs')
+    results = dsw.run_sweep(jobs, args.workers, args.timeout, args.keep_states)
+    print(dsw.summarize(results))
+    if args.out is not None:
+        dsw.save(args.out, results)
+        print(f'saved to {args.out}.json')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+
+import d2d.dynamic as ddyn
+import d2d.scenario as dds
+import d2d.benchmark as dbench
+
+#
+# Integrators accuracy versus speed, against a tight fixed step reference
+#
+# ex: ./12_bench_integrators.py --scens line,circle_gust --dts 0.01,0.05,0.1 --substeps 1,4 --out /tmp/integrators.json
+#
+
+def parse_command_line():
+    parser = argparse.ArgumentParser(description='Benchmarks the integrators on the registered scenarios.')
+    parser.add_argument('--scens', help='comma separated scenario names, or all', default='all')
+    parser.add_argument('--dts', help='comma separated time steps, default to the scenario one', default=None)
+    parser.add_argument('--integrators', help=f'comma separated integrators among {ddyn.integrators}', default=','.join(ddyn.integrators))
+    parser.add_argument('--substeps', help='comma separated substeps for the fixed step integrators', default='1')
+    parser.add_argument('--repeat', help='timing repetitions (best is kept)', type=int, default=1)
+    parser.add_argument('--out', help='json output filename', default=None)
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line()
+    scens = sorted(dds._scenarios) if args.scens == 'all' else args.scens.split(',')
+    dts = [None] if args.dts is None else [float(_dt) for _dt in args.dts.split(',')]
+    substeps = [int(_s) for _s in args.substeps.split(',')]
+    res = dbench.bench_integrators(scens, dts, args.integrators.split(','), substeps, args.repeat)
+    if args.out is not None:
+        dbench.save(args.out, res)
+        print(f'saved to {args.out}')
+
+if __name__ == "__main__":
+    main()
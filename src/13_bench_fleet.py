@@ -0,0 +1,43 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+
+import d2d.dynamic as ddyn
+import d2d.benchmark as dbench
+
+#
+# Closed loop fleet scaling: controller cost per aircraft, real time factor and memory versus fleet size
+#
+# ex: ./13_bench_fleet.py --sizes 1,10,100,500 --ctls dfff,dfff_sched,dfff_fleet,pp --out /tmp/fleet.json --plot /tmp/fleet.png
+#
+
+def parse_command_line():
+    parser = argparse.ArgumentParser(description='Benchmarks closed loop control of growing fleets.')
+    parser.add_argument('--sizes', help='comma separated fleet sizes', default=','.join(map(str, dbench.default_sizes)))
+    parser.add_argument('--ctls', help='comma separated controllers among dfff, dfff_sched (gain scheduled), dfff_tv (time varying lqr), '
+                        'dfff_fleet, dfff_fleet_sched (one batched controller for the fleet) and pp', default='dfff,dfff_sched,dfff_fleet,pp')
+    parser.add_argument('--dt', help='control and integration period (s)', type=float, default=0.05)
+    parser.add_argument('--ticks', help='number of control periods', type=int, default=100)
+    parser.add_argument('--integrator', help=f'one of {ddyn.integrators}', default='zoh')
+    parser.add_argument('--out', help='json output filename', default=None)
+    parser.add_argument('--plot', help='filename of the scaling curves plot', default=None)
+    args = parser.parse_args()
+    return args
+
+def main():
+    args = parse_command_line()
+    sizes = [int(_n) for _n in args.sizes.split(',')]
+    res = dbench.bench_fleet_scaling(sizes, args.ctls.split(','), args.dt, args.ticks, args.integrator)
+    for ctl in args.ctls.split(','):
+        print(f'{ctl}: {dbench.max_realtime_fleet(res, ctl)} aircraft in real time at {1/args.dt:.0f}Hz (largest benchmarked size)')
+    if args.out is not None:
+        dbench.save(args.out, res)
+        print(f'saved to {args.out}')
+    if args.plot is not None:
+        import matplotlib; matplotlib.use('Agg')
+        dbench.plot_fleet_scaling(res, args.plot)
+        print(f'saved plot to {args.plot}')
+
+if __name__ == "__main__":
+    main()
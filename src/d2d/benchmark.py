@@ -0,0 +1,184 @@
+import time as _time, platform, json, traceback, tracemalloc, datetime
+import numpy as np
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.trajectory as ddt
+import d2d.scenario as dds
+import d2d.simulation as dsim
+import d2d.utils as d2u
+
+#
+# Integrators accuracy versus speed.
+# For each scenario and time step, a closed loop reference is run with a tight fixed step integrator and its inputs recorded.
+# Every integrator then replays those inputs in open loop on the whole fleet, so that only the integration is timed,
+# and its states are compared to the reference ones.
+#
+ref_integrator, ref_substeps = 'rk4', 32
+
+def reference_run(scen, integrator=ref_integrator, substeps=ref_substeps):
+    fleet = ddyn.Fleet(scen.aircrafts)
+    ctls = dsim.make_controllers(scen, record=False)
+    Xs, Us, Yrefs = dsim.run_fleet_simulation(scen.time, fleet, scen.windfield, ctls, scen.X0s, scen.perts, integrator, substeps)
+    return np.stack(Xs, axis=1), np.stack(Us, axis=1) # (T, n, s_size), (T, n, i_size)
+
+def replay(time, fleet, windfield, X0s, U, perts, integrator, substeps=1):
+    # open loop integration of the (T, n, i_size) inputs of a run, perturbations applied as in run_fleet_simulation
+    X = np.zeros((len(time), len(fleet), ddyn.Aircraft.s_size))
+    X[0] = X0s
+    perts = dsim.as_schedule(perts, time).cursor(time[0])
+    for i in range(1, len(time)):
+        X[i] = fleet.disc_dyn(X[i-1], U[i-1], windfield, time[i-1], time[i]-time[i-1], integrator, substeps)
+        for ac, dX in perts.pop(time[i]): X[i, ac] += dX
+    return X
+
+def bench_scenario(name, dt, integrators, substeps=(1,), repeat=1):
+    # one entry per (integrator, substeps), wall time is the best of repeat replays
+    scen, desc = dds.get(name)
+    if dt is not None: scen.set_dt(dt)
+    fleet, n_steps = ddyn.Fleet(scen.aircrafts), len(scen.time)-1
+    Xref, Uref = reference_run(scen)
+    entries = []
+    for integrator, _sub in [(_i, _s) for _i in integrators for _s in ((1,) if _i == 'odeint' else substeps)]:
+        e = {'scen':name, 'dt':float(scen.time[1]-scen.time[0]), 'integrator':integrator, 'substeps':_sub,
+             'n_aircraft':len(fleet), 'n_steps':n_steps, 'status':'ok'}
+        try:
+            walls = []
+            for k in range(repeat):
+                _start = _time.perf_counter()
+                X = replay(scen.time, fleet, scen.windfield, scen.X0s, Uref, scen.perts, integrator, _sub)
+                walls.append(_time.perf_counter()-_start)
+            e['wall'] = min(walls)
+            e['steps_per_s'] = n_steps/e['wall']
+            e['err_pos_max'] = float(np.max(np.linalg.norm(X[..., :2]-Xref[..., :2], axis=-1)))
+            e['err_psi_max'] = float(np.max(np.abs(d2u.norm_mpi_pi(X[..., ddyn.Aircraft.s_psi]-Xref[..., ddyn.Aircraft.s_psi]))))
+        except Exception:
+            e['status'], e['error'] = 'failed', traceback.format_exc()
+        entries.append(e)
+    return entries
+
+def bench_integrators(scens, dts=(None,), integrators=None, substeps=(1,), repeat=1, verbose=True):
+    integrators = ddyn.integrators if integrators is None else integrators
+    res = {'reference':{'integrator':ref_integrator, 'substeps':ref_substeps}, 'host':host_info(), 'results':[]}
+    for name in scens:
+        for dt in dts:
+            try: entries = bench_scenario(name, dt, integrators, substeps, repeat)
+            except Exception:
+                entries = [{'scen':name, 'dt':dt, 'status':'failed', 'error':traceback.format_exc()}]
+            res['results'] += entries
+            if verbose: print(summarize(entries), flush=True)
+    return res
+
+def summarize(entries):
+    r = ''
+    for e in entries:
+        if e['status'] != 'ok':
+            r += f"{e['scen']:12s} dt {str(e['dt']):6s} {e.get('integrator', ''):6s} failed\n"; continue
+        r += (f"{e['scen']:12s} dt {e['dt']:.3f} {e['integrator']:6s} x{e['substeps']:<3d} {e['wall']*1e3:8.1f}ms "
+              f"{e['steps_per_s']:9.0f} steps/s  pos err {e['err_pos_max']:.2e}m  psi err {np.rad2deg(e['err_psi_max']):.2e}deg\n")
+    return r.rstrip('\n')
+
+def host_info():
+    return {'python':platform.python_version(), 'numpy':np.__version__, 'machine':platform.machine(),
+            'processor':platform.processor(), 'date':datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+#
+# Closed loop fleet scaling: how many aircraft can be controlled in real time.
+# Synthetic fleets fly circles and racetrack patrols (CompositeTraj), spread on a grid. One controller per aircraft
+# is run at every tick and the fleet integrated at once; controllers and integration are timed separately.
+# Memory is the peak of the python allocations (setup and a few ticks), traced in a separate pass.
+#
+default_sizes = [1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+def synthetic_fleet(n, wind=(2., 0.), v=10., seed=0, spacing=200.):
+    rng = np.random.default_rng(seed)
+    windfield, trajs = ddg.WindField(list(wind)), []
+    for i in range(n):
+        c, r = np.array([spacing*(i%25), spacing*(i//25)]), rng.uniform(30., 60.)
+        if i%2 == 0:
+            trajs.append(ddt.TrajectoryCircle(c=c, r=r*rng.choice([-1, 1]), v=v, alpha0=rng.uniform(-np.pi, np.pi)))
+        else:
+            l1 = ddt.TrajectoryLine(c+[-r, -r], c+[r, -r], v=v)
+            c1 = ddt.TrajectoryCircle(c=c+[r, 0.], r=r, v=v, alpha0=-np.pi/2, dalpha=np.pi)
+            l2 = ddt.TrajectoryLine(c+[r, r], c+[-r, r], v=v)
+            c2 = ddt.TrajectoryCircle(c=c+[-r, 0.], r=r, v=v, alpha0=np.pi/2, dalpha=np.pi)
+            trajs.append(ddt.CompositeTraj([l1, c1, l2, c2]))
+    aircrafts = [ddyn.Aircraft() for i in range(n)]
+    X0s = np.array([ddg.DiffFlatness.state_and_input_from_output(traj.get(0.), windfield.sample(0., traj.get(0.)[0]), ac)[0]
+                    for traj, ac in zip(trajs, aircrafts)])
+    return trajs, aircrafts, windfield, X0s
+
+def make_fleet_controllers(ctl, trajs, aircrafts, windfield):
+    if ctl in ['dfff', 'dfff_sched', 'dfff_tv']:
+        return [ddg.DFFFController(traj, ac, windfield, record=False, scheduled=ctl=='dfff_sched', tvlqr=ctl=='dfff_tv')
+                for traj, ac in zip(trajs, aircrafts)]
+    if ctl in ['dfff_fleet', 'dfff_fleet_sched']: # a single controller for the whole fleet
+        return ddg.FleetDFFFController(trajs, aircrafts, windfield, scheduled=ctl=='dfff_fleet_sched')
+    if ctl == 'pp': return [ddg.PurePursuitControler(traj, record=False) for traj in trajs]
+    raise ValueError(f'unknown controller {ctl}, available: dfff, dfff_sched, dfff_tv, dfff_fleet, dfff_fleet_sched, pp')
+
+def _fleet_run(n, ctl, dt, n_ticks, integrator, seed):
+    trajs, aircrafts, windfield, X = synthetic_fleet(n, seed=seed)
+    ctls = make_fleet_controllers(ctl, trajs, aircrafts, windfield)
+    fleet, t_ctl, t_int = ddyn.Fleet(aircrafts), 0., 0.
+    for k in range(n_ticks):
+        t = k*dt
+        _start = _time.perf_counter()
+        U = ctls.get(X, t) if hasattr(ctls, 'trajs') else np.array([_c.get(_X, t) for _c, _X in zip(ctls, X)])
+        _mid = _time.perf_counter()
+        X = fleet.disc_dyn(X, U, windfield, t, dt, integrator)
+        t_ctl, t_int = t_ctl+_mid-_start, t_int+_time.perf_counter()-_mid
+    return t_ctl, t_int
+
+def bench_fleet(n, ctl='dfff', dt=0.05, n_ticks=100, integrator='zoh', seed=0, mem_ticks=5):
+    tracemalloc.start()
+    _fleet_run(n, ctl, dt, mem_ticks, integrator, seed)
+    mem_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    t_ctl, t_int = _fleet_run(n, ctl, dt, n_ticks, integrator, seed)
+    return {'n_aircraft':n, 'ctl':ctl, 'dt':dt, 'n_ticks':n_ticks, 'integrator':integrator,
+            'ctl_us_per_ac_tick':t_ctl/n_ticks/n*1e6, 'int_us_per_ac_tick':t_int/n_ticks/n*1e6,
+            'tick_ms':(t_ctl+t_int)/n_ticks*1e3,
+            'rtf':n_ticks*dt/(t_ctl+t_int), # simulated over wall time, real time when >= 1
+            'mem_peak_mb':mem_peak/2**20}
+
+def bench_fleet_scaling(sizes=default_sizes, ctls=('dfff', 'dfff_sched', 'dfff_fleet', 'pp'), dt=0.05, n_ticks=100, integrator='zoh', seed=0, verbose=True):
+    res = {'host':host_info(), 'results':[]}
+    for ctl in ctls:
+        for n in sizes:
+            e = bench_fleet(n, ctl, dt, n_ticks, integrator, seed)
+            res['results'].append(e)
+            if verbose: print(summarize_fleet([e]), flush=True)
+    return res
+
+def max_realtime_fleet(res, ctl):
+    # largest benchmarked fleet still running in real time
+    ns = [e['n_aircraft'] for e in res['results'] if e['ctl'] == ctl and e['rtf'] >= 1.]
+    return max(ns) if ns else 0
+
+def summarize_fleet(entries):
+    return '\n'.join([f"{e['ctl']:16s} {e['n_aircraft']:4d} aircraft  ctl {e['ctl_us_per_ac_tick']:8.1f}us/ac/tick  "
+                      f"int {e['int_us_per_ac_tick']:6.1f}us/ac/tick  tick {e['tick_ms']:8.2f}ms  rtf {e['rtf']:8.2f}  "
+                      f"mem {e['mem_peak_mb']:7.1f}MB" for e in entries])
+
+def plot_fleet_scaling(res, filename=None):
+    import matplotlib.pyplot as plt
+    _f = plt.figure(tight_layout=True, figsize=[16., 5.])
+    _a = _f.subplots(1, 3)
+    for ctl in sorted(set([e['ctl'] for e in res['results']])):
+        es = [e for e in res['results'] if e['ctl'] == ctl]
+        ns = [e['n_aircraft'] for e in es]
+        for _ax, k in zip(_a, ['ctl_us_per_ac_tick', 'rtf', 'mem_peak_mb']):
+            _ax.loglog(ns, [e[k] for e in es], '.-', label=ctl)
+            _ax.set_title(k); _ax.set_xlabel('aircraft'); _ax.grid(True, which='both')
+    _a[1].axhline(1., color='k', ls='--')
+    _a[0].legend()
+    if filename is not None: _f.savefig(filename)
+    return _f
+
+def save(filename, res):
+    with open(filename, 'w') as f: json.dump(res, f, indent=1)
+
+def load(filename):
+    with open(filename) as f: return json.load(f)
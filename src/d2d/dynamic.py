@@ -1,6 +1,58 @@
 import numpy as np, scipy.integrate
 
 import d2d.utils as d2u
+import d2d.kernels as d2k
+
+#
+# Fixed step explicit integrators, f(X, t) -> Xdot
+#
+def _step_euler(f, X, t, dt):
+    return X + dt*f(X, t)
+
+def _step_heun(f, X, t, dt):
+    k1 = f(X, t)
+    k2 = f(X+dt*k1, t+dt)
+    return X + dt/2*(k1+k2)
+
+def _step_rk4(f, X, t, dt):
+    k1 = f(X, t)
+    k2 = f(X+dt/2*k1, t+dt/2)
+    k3 = f(X+dt/2*k2, t+dt/2)
+    k4 = f(X+dt*k3, t+dt)
+    return X + dt/6*(k1+2*k2+2*k3+k4)
+
+_fixed_step = {'euler': _step_euler, 'heun': _step_heun, 'rk4': _step_rk4}
+integrators = ['odeint'] + list(_fixed_step) + ['zoh'] # odeint (adaptive) is the reference
+
+def integrate_zoh(X, U, wind, t, dt, tau_phi, tau_v, g=9.81, substeps=1):
+    # semi-analytic step under zero order hold of the input:
+    # phi and va are first order lags whose exact solution is used both at the end of the step
+    # and inside a RK4 integration of the x, y, psi kinematics, so that large steps remain accurate.
+    # X is (..., s_size), U is (..., i_size), wind(t, pos) returns (..., 2), taus broadcast against X[..., 0]
+    X, U = np.asarray(X, dtype=float), np.asarray(U, dtype=float)
+    phi_c, v_c = U[..., Aircraft.i_phi], U[..., Aircraft.i_va]
+    dphi0, dv0 = X[..., Aircraft.s_phi]-phi_c, X[..., Aircraft.s_va]-v_c
+    def lags(s): return phi_c+dphi0*np.exp(-s/tau_phi), v_c+dv0*np.exp(-s/tau_v)
+    def kin(P, s):
+        phi, v = lags(s)
+        Wxy = wind(t+s, P[..., :2])
+        psi = P[..., 2]
+        return np.stack([v*np.cos(psi)+Wxy[..., 0], v*np.sin(psi)+Wxy[..., 1], g/v*np.tan(phi)], axis=-1)
+    P, h = X[..., :Aircraft.s_psi+1], dt/substeps
+    for i in range(substeps):
+        P = _step_rk4(kin, P, i*h, h)
+    Xkp1 = np.empty_like(X)
+    Xkp1[..., :Aircraft.s_psi+1] = P
+    Xkp1[..., Aircraft.s_phi], Xkp1[..., Aircraft.s_va] = lags(dt)
+    return Xkp1
+
+def integrate_fixed_step(method, f, X, t, dt, substeps=1):
+    try: step = _fixed_step[method]
+    except KeyError: raise ValueError(f'unknown integrator {method}, available: {integrators}')
+    h = dt/substeps
+    for i in range(substeps):
+        X = step(f, X, t+i*h, h)
+    return X
 
 class Aircraft:
     i_phi, i_va, i_size = np.arange(3)
@@ -10,34 +62,72 @@ class Aircraft:
     def __init__(self):
         self.tau_phi, self.tau_v = 0.1, 1. # roll and speed time constants
 
-    def cont_dyn(self, X, t, U, W):
-        wx, wy = W.sample(t, X[:2])
-        (x, y, psi, phi, v), (phi_c, v_c) = X, U
-        Xdot=[ v*np.cos(psi)+wx,
-               v*np.sin(psi)+wy,
-               self.g/v*np.tan(phi),
-               -1/self.tau_phi*(phi-phi_c),
-               -1/self.tau_v*(v-v_c)]
-        return Xdot
-
-    def disc_dyn(self, Xk, Uk, W, t, dt):
-        Xk, Xkp1 = scipy.integrate.odeint(self.cont_dyn, Xk, [t, t+dt], args=(Uk, W))
+    def cont_dyn(self, X, t, U, W): # see d2d.kernels for the model
+        return d2k.dyn1(X, U, W.sample(t, X[:2]), self.tau_phi, self.tau_v, self.g)
+
+    def disc_dyn(self, Xk, Uk, W, t, dt, method='odeint', substeps=1):
+        if method == 'odeint':
+            Xk, Xkp1 = scipy.integrate.odeint(self.cont_dyn, Xk, [t, t+dt], args=(Uk, W))
+        elif method == 'zoh':
+            _w = lambda _t, _p: np.asarray(W.sample(_t, _p), dtype=float)
+            Xkp1 = integrate_zoh(Xk, Uk, _w, t, dt, self.tau_phi, self.tau_v, self.g, substeps)
+        else:
+            _f = lambda _X, _t: np.array(self.cont_dyn(_X, _t, Uk, W))
+            Xkp1 = integrate_fixed_step(method, _f, np.asarray(Xk, dtype=float), t, dt, substeps)
         Xkp1[self.s_psi] = d2u.norm_mpi_pi(Xkp1[self.s_psi])
         return Xkp1
 
 
 
     def cont_jac(self, Xr, Ur, t, W):
-        psi, phi, va = Xr[Aircraft.s_psi], Xr[Aircraft.s_phi], Xr[Aircraft.s_va]
-        g = self.g
-        spsi, cpsi = np.sin(psi), np.cos(psi)
-        cphi2, tan_phi = np.cos(phi)**2, np.tan(phi)
-        ' il manque un moins dans le jacobien?'
-        A = np.array([ [0., 0., -va*spsi, 0.            , cpsi],
-                       [0., 0.,  va*cpsi, 0.            , spsi],
-                       #[0., 0.,  0.,      g/va/(1+cphi2), -g/va**2*tan_phi],
-                       [0., 0.,  0.,      g/va/(1+cphi2), g/va**2*tan_phi],
-                       [0., 0.,  0.,     -1/self.tau_phi, 0],
-                       [0., 0.,  0.,      0.,             -1/self.tau_v]])
-        B = np.array([ [0, 0], [0,0], [0,0], [1/self.tau_phi, 0], [0, 1/self.tau_v]])
-        return A, B
+        return d2k.jac1(Xr, Ur, (0., 0.), self.tau_phi, self.tau_v, self.g) # the wind does not enter the jacobian
+
+    def cont_jac_batch(self, Xrs, Urs, ts, Ws):
+        # Xrs (T, s_size), Urs (T, i_size), Ws (T, 2) -> A (T, s_size, s_size), B (T, s_size, i_size)
+        return cont_jacs(Xrs, self.tau_phi, self.tau_v, self.g)
+
+def cont_jacs(Xrs, tau_phi, tau_v, g=9.81):
+    # same as Aircraft.cont_jac for a stack of reference states, taus are scalars or (T,) arrays
+    return d2k.jac(Xrs, np.zeros(Aircraft.i_size), np.zeros(2), tau_phi, tau_v, g)
+
+
+
+def sample_winds(W, t, P):
+    # wind at a set of (N, 2) positions, batched when the windfield supports it
+    try: return np.asarray(W.sample_batch(t, P), dtype=float)
+    except AttributeError: return np.array([W.sample(t, _p) for _p in P], dtype=float)
+
+class Fleet:
+    # a set of aircraft integrated together, states stored as a (N, s_size) array
+    def __init__(self, aircrafts):
+        self.aircrafts = aircrafts
+        self.tau_phi = np.array([ac.tau_phi for ac in aircrafts])
+        self.tau_v = np.array([ac.tau_v for ac in aircrafts])
+        self.g = Aircraft.g
+
+    def __len__(self): return len(self.aircrafts)
+
+    def cont_dyn(self, Xs, t, Us, W):
+        Xs, Us = np.asarray(Xs, dtype=float), np.asarray(Us, dtype=float)
+        Ws = sample_winds(W, t, Xs[:, Aircraft.s_slice_pos])
+        return d2k.dyn(Xs, Us, Ws, self.tau_phi, self.tau_v, self.g)
+
+    def disc_dyn(self, Xks, Uks, W, t, dt, method='odeint', substeps=1):
+        n = len(self.aircrafts)
+        if method == 'odeint':
+            _f = lambda _X, _t: self.cont_dyn(_X.reshape(n, Aircraft.s_size), _t, Uks, W).ravel()
+            _X0 = np.asarray(Xks, dtype=float).ravel()
+            Xk, Xkp1 = scipy.integrate.odeint(_f, _X0, [t, t+dt])
+            Xkp1 = Xkp1.reshape(n, Aircraft.s_size)
+        elif method == 'zoh':
+            _w = lambda _t, _p: sample_winds(W, _t, _p)
+            Xkp1 = integrate_zoh(Xks, Uks, _w, t, dt, self.tau_phi, self.tau_v, self.g, substeps)
+        else:
+            _f = lambda _X, _t: self.cont_dyn(_X, _t, Uks, W)
+            Xkp1 = integrate_fixed_step(method, _f, np.asarray(Xks, dtype=float), t, dt, substeps)
+        Xkp1[:, Aircraft.s_psi] = d2u.norm_mpi_pi(Xkp1[:, Aircraft.s_psi])
+        return Xkp1
+
+    def cont_jac(self, Xrs, Urs, t, W):
+        # one linearization per aircraft, with their own time constants
+        return cont_jacs(Xrs, self.tau_phi, self.tau_v, self.g)
@@ -1,4 +1,4 @@
-import numpy as np, scipy.integrate
+import numpy as np, scipy.integrate, scipy.linalg
 
 
 import matplotlib.pyplot as plt
@@ -7,88 +7,224 @@ import matplotlib.pyplot as plt
 import d2d.trajectory as ddt
 from d2d.trajectory import Trajectory
 import d2d.dynamic as ddyn
+import d2d.wind as d2w
+import d2d.kernels as d2k
+import d2d.recorder as d2rec
 from d2d.dynamic import Aircraft
 
 
 def norm_mpi_pi(v): return ( v + np.pi) % (2 * np.pi ) - np.pi
 
-class WindField:
-    def __init__(self, w=[0.,0.]):
-        self.w = w
-    def sample(self, t, loc):
-        return self.w
-    def summarize(self):
-        r = f'{self.w} m/s'
-        return r
-
+WindField = d2w.UniformWindField # constant wind, see d2d.wind for the sampling interface
+
+def wind_rate(wind, t, loc, vel):
+    # time derivative of the wind seen along a trajectory at loc with (ground) velocity vel,
+    # zero for fields without spatial or temporal structure (no sample_jac)
+    try: J = np.asarray(wind.sample_jac(t, loc))
+    except AttributeError: return np.zeros(2)
+    return J[:, 0]*vel[0] + J[:, 1]*vel[1] + J[:, 2]
+
+def wind_rates(wind, ts, Ys):
+    # wind_rate along (N, nder+1, 2) sampled flat outputs, in one pass for fields with a batched jacobian (jac_points)
+    if hasattr(wind, 'jac_points'):
+        J = wind.jac_points(ts, Ys[:, 0, 0], Ys[:, 0, 1])
+        return J[..., 0]*Ys[:, 1, :1] + J[..., 1]*Ys[:, 1, 1:] + J[..., 2]
+    if not hasattr(wind, 'sample_jac'): return np.zeros((len(Ys), 2))
+    return np.array([wind_rate(wind, t, Y[0], Y[1]) for t, Y in zip(np.broadcast_to(ts, len(Ys)), Ys)])
  
 class DiffFlatness:
-    def state_and_input_from_output(Ys, W, ac):
-        X, U, Xdot = [np.zeros(_l) for _l in [Aircraft.s_size, Aircraft.i_size, Aircraft.s_size]]
-        x, y = Ys[0, Trajectory.cx], Ys[0, Trajectory.cy]
-        xd, yd = Ys[1,Trajectory.cx], Ys[1,Trajectory.cy]
-        xdd, ydd = Ys[2,Trajectory.cx], Ys[2,Trajectory.cy]
-        X[Aircraft.s_x], X[Aircraft.s_y] = x, y         # x, y
-        vax, vay = xd - W[0], yd - W[1]         
-        va2 = vax**2+vay**2; va = np.sqrt(va2)
-        X[Aircraft.s_va] = va                           # va
-        X[Aircraft.s_psi] = np.arctan2(vay, vax)        # psi
-        wxdot, wydot = 0., 0. # wind is stationnary
-        vaxd, vayd = xdd-wxdot, ydd-wydot
-        Xdot[Aircraft.s_va] = (vax*vaxd + vay*vayd)/va  # va dot
-        Xdot[Aircraft.s_psi] = (vayd*vax-vaxd*vay)/va2  # psi dot
-
-        g=9.81 # phi
-        X[Aircraft.s_phi] = np.arctan((vayd*vax-vaxd*vay)/va/g)
-        # U
-        #Xdot[Aircraft.s_phi] # phi_dot
-        U[Aircraft.i_phi] = ac.tau_phi * Xdot[Aircraft.s_phi] + X[Aircraft.s_phi]
-        U[Aircraft.i_va] = ac.tau_v * Xdot[Aircraft.s_va] + X[Aircraft.s_va]
-        
-        
-        return X, U, Xdot
+    def state_and_input_from_output(Ys, W, ac, Wdot=(0., 0.)):
+        # reference state, input and state derivative for the flat output Ys (position and its derivatives),
+        # the wind W and its time derivative along the trajectory (see wind_rate), generated in d2d.kernels
+        return d2k.flatness1(Ys, W, Wdot, ac.tau_phi, ac.tau_v, Aircraft.g)
+
+    def state_and_input_from_outputs(Ys, W, ac, Wdot=(0., 0.)):
+        # same for (..., nder+1, 2) flat outputs and broadcasting (..., 2) winds, in one pass
+        # ac parameters can be arrays too (eg a dynamic.Fleet)
+        return d2k.flatness(Ys, W, Wdot, ac.tau_phi, ac.tau_v, ac.g)
+
+    def reference(traj, wind, ac, ts):
+        # flat outputs, states, inputs and state derivatives of a trajectory over a time vector
+        Ys = traj.get_batch(ts)
+        W = wind.sample(ts, Ys[:, 0, 0], Ys[:, 0, 1])
+        Xr, Ur, Xrdot = DiffFlatness.state_and_input_from_outputs(Ys, W, ac, wind_rates(wind, ts, Ys))
+        return Ys, Xr, Ur, Xrdot
 
 
 import control
 
+# controllers internal state, for checkpointing simulations
+# records are append only lists: snapshots keep a reference and a length instead of a copy
+def snapshot_records(obj, names):
+    return {k: (getattr(obj, k), len(getattr(obj, k))) for k in names if hasattr(obj, k)}
+
+def restore_records(obj, records):
+    for k, (l, n) in records.items(): setattr(obj, k, list(l[:n]))
+
+def lqr_batch(A, B, Q, R, K0=None, iters=2, tol=1e-8):
+    # continuous LQR gains for a stack of (A, B) pairs, (N,n,n) and (N,n,m), with shared Q and R weights
+    # K0: stabilizing gains close to the solution (eg previous control step), refined by Newton-Kleinman iterations,
+    # otherwise - or when not converged - the stable invariant subspace of the hamiltonian gives P = V21 V11^-1
+    n = A.shape[-1]
+    Q, Rinv = np.diag(Q), np.diag(1./np.asarray(R, dtype=float))
+    Bt = np.swapaxes(B, -1, -2)
+    BRB = B @ Rinv @ Bt
+    if K0 is not None:
+        K, I = K0, np.eye(n)
+        for i in range(iters): # lyapunov equation Acl' P + P Acl + Q + K' R K = 0, solved in vectorized form
+            Acl = A - B @ K
+            L = np.kron(I, np.swapaxes(Acl, -1, -2)) + np.kron(np.swapaxes(Acl, -1, -2), I)
+            M = Q + np.swapaxes(K, -1, -2) @ np.diag(R) @ K
+            P = np.linalg.solve(L, -M.reshape(*M.shape[:-2], n*n, 1)).reshape(M.shape)
+            K = Rinv @ Bt @ P
+        res = np.swapaxes(A, -1, -2) @ P + P @ A - P @ BRB @ P + Q
+        bad = np.max(np.abs(res), axis=(-1, -2)) > tol*(1+np.max(np.abs(P), axis=(-1, -2)))
+        if np.any(bad): K[bad] = lqr_batch(A[bad], B[bad], np.diag(Q), R)
+        return K
+    H = np.block([[A, -BRB], [-np.broadcast_to(Q, A.shape), -np.swapaxes(A, -1, -2)]])
+    E, V = np.linalg.eig(H)
+    idx = np.argsort(E.real, axis=-1)[..., None, :n]
+    V = np.take_along_axis(V, idx, axis=-1)
+    P = np.real(V[..., n:, :] @ np.linalg.inv(V[..., :n, :]))
+    return Rinv @ Bt @ P
+
+#
+# Gain scheduling of the dim 3 (x, y, psi) feedback. The linearization only depends on heading through a rotation
+# of the position error, which leaves isotropic position weights unchanged: K(va, phi, psi) = K(va, phi, 0) diag(R(psi)', 1).
+# Gains are tabulated on a (va, phi) grid and interpolated bilinearly, get returns None outside the table.
+#
+class LQRGainTable:
+    def __init__(self, Q, R, vas=np.arange(6., 20.01, 0.5), phis=np.deg2rad(np.arange(-60., 60.01, 2.5)), g=Aircraft.g):
+        if Q[0] != Q[1]: raise ValueError('heading scheduling needs equal x and y weights')
+        self.Q, self.R, self.vas, self.phis = list(Q), list(R), np.asarray(vas), np.asarray(phis)
+        va, phi = np.meshgrid(self.vas, self.phis, indexing='ij')
+        Xr = np.zeros(va.shape+(Aircraft.s_size,))
+        Xr[..., Aircraft.s_phi], Xr[..., Aircraft.s_va] = phi, va
+        A, B = ddyn.cont_jacs(Xr.reshape(-1, Aircraft.s_size), 1., 1., g) # time constants don't enter the dim 3 blocks
+        K = lqr_batch(A[:, :3, :3], A[:, :3, 3:], self.Q, self.R)
+        self.K = K.reshape(len(self.vas), len(self.phis), Aircraft.i_size, 3)
+
+    def get(self, va, phi, psi):
+        fv, fp = (va-self.vas[0])/(self.vas[1]-self.vas[0]), (phi-self.phis[0])/(self.phis[1]-self.phis[0])
+        nv, nphi = len(self.vas), len(self.phis)
+        if not (0 <= fv <= nv-1 and 0 <= fp <= nphi-1): return None
+        i, j = min(int(fv), nv-2), min(int(fp), nphi-2)
+        a, b = fv-i, fp-j
+        K = (1-a)*(1-b)*self.K[i, j] + a*(1-b)*self.K[i+1, j] + (1-a)*b*self.K[i, j+1] + a*b*self.K[i+1, j+1]
+        c, s = np.cos(psi), np.sin(psi)
+        K[:, :2] = K[:, :2] @ np.array([[c, s], [-s, c]])
+        return K
+
+    def get_batch(self, va, phi, psi):
+        # get for (N,) arrays: (N, i_size, 3) gains, and the mask of the ones inside the table (others are zero)
+        fv, fp = (va-self.vas[0])/(self.vas[1]-self.vas[0]), (phi-self.phis[0])/(self.phis[1]-self.phis[0])
+        nv, nphi = len(self.vas), len(self.phis)
+        ok = (0 <= fv) & (fv <= nv-1) & (0 <= fp) & (fp <= nphi-1)
+        i, j = np.clip(fv, 0, nv-2).astype(int), np.clip(fp, 0, nphi-2).astype(int)
+        a, b = (np.clip(fv, 0, nv-1)-i)[:, None, None], (np.clip(fp, 0, nphi-1)-j)[:, None, None]
+        K = (1-a)*(1-b)*self.K[i, j] + a*(1-b)*self.K[i+1, j] + (1-a)*b*self.K[i, j+1] + a*b*self.K[i+1, j+1]
+        c, s = np.cos(psi), np.sin(psi)
+        K[..., :2] = K[..., :2] @ np.stack([np.stack([c, s], -1), np.stack([-s, c], -1)], -2)
+        K[~ok] = 0.
+        return K, ok
+
+_gain_tables = {}
+def gain_table(Q, R, g=Aircraft.g): # shared between controllers with the same weights
+    key = (tuple(Q), tuple(R), g)
+    if key not in _gain_tables: _gain_tables[key] = LQRGainTable(Q, R, g=g)
+    return _gain_tables[key]
+
+#
+# Time varying LQR: the reference is linearized at every sample of the controller grid and a finite horizon
+# discrete riccati recursion, ended on the steady state cost of the last sample, gives the dim 3 gains K(t).
+# The (x, y, psi) block A1 is nilpotent (A1^2 = 0): its zero order hold discretization is exact at first order.
+# Reference states and inputs are stored too, so that a control step on the grid is only lookups.
+#
+class TVLQRGains:
+    def __init__(self, traj, ac, wind, Q, R, dt=0.01, t0=0., duration=None):
+        duration = traj.duration if duration is None else duration
+        self.t0, self.dt = t0, dt
+        self.time = t0 + np.arange(0., duration+dt/2, dt)
+        Ys, self.Xr, self.Ur, Xrdot = DiffFlatness.reference(traj, wind, ac, self.time)
+        A, B = ddyn.cont_jacs(self.Xr, ac.tau_phi, ac.tau_v, ac.g)
+        A1, B1 = A[:, :3, :3], A[:, :3, 3:]
+        I = np.eye(3)
+        Ad, Bd = I + A1*dt, (I*dt + A1*dt**2/2) @ B1
+        Qd, Rd = np.diag(Q)*dt, np.diag(R)*dt
+        P = scipy.linalg.solve_discrete_are(Ad[-1], Bd[-1], Qd, Rd)
+        self.K = np.zeros((len(self.time), Aircraft.i_size, Aircraft.s_size))
+        for k in range(len(self.time)-1, -1, -1):
+            BtP = Bd[k].T @ P
+            K1 = np.linalg.solve(Rd + BtP @ Bd[k], BtP @ Ad[k])
+            P = Qd + Ad[k].T @ P @ (Ad[k] - Bd[k] @ K1)
+            P = (P+P.T)/2
+            self.K[k, :, :3] = K1
+
+    def get(self, t):
+        # (Xr, Ur, K) on the grid, (None, None, K) with an interpolated K between samples, None outside of the horizon
+        f = (t-self.t0)/self.dt
+        if not (-1e-6 <= f <= len(self.time)-1+1e-6): return None
+        k = int(round(f))
+        if abs(f-k) < 1e-6: return self.Xr[k], self.Ur[k], self.K[k]
+        k = min(int(f), len(self.time)-2)
+        return None, None, (k+1-f)*self.K[k] + (f-k)*self.K[k+1]
+
 class DFFFController:
-    def __init__(self, traj, ac, wind, record=True):
+    def __init__(self, traj, ac, wind, record=True, scheduled=False, tvlqr=False):
         self.traj, self.ac, self.wind = traj, ac, wind
         self.dt = 0.01
         self.time = np.arange(0, traj.duration, self.dt)
         self.carrot, self.ref_pos = [0,0], [0,0]
-        self.record = record
-        if self.record:
+        # record: True for lists of everything, or a recorder.RingRecorder for a bounded history
+        self.recorder = record if isinstance(record, d2rec.RingRecorder) else None
+        self.record = self.recorder is not None or record
+        if self.record and self.recorder is None:
             self.t, self.X, self.Xref, self.K, self.U, self.fb_poles = [], [], [], [], [], []
         self.disable_feedback = False
+        self.Q, self.R = [1., 1., 20.], [500, 2000]    # dim 3 feedback LQR weights
+        self.err_sats = np.array([20, 20 , np.pi/3, np.pi/4, 1])
+        self.phisat, self.vmin, self.vmax = np.deg2rad(45), 9, 15
+        # scheduled gains (LQRGainTable), the riccati equation is solved online when None or outside the table
+        self.gain_table = gain_table(self.Q, self.R, ac.g) if scheduled else None
+        self.n_fallback = 0
+        # time varying gains along the whole reference (TVLQRGains), the other modes are used outside of its horizon
+        self.tv_gains = TVLQRGains(traj, ac, wind, self.Q, self.R, self.dt) if tvlqr else None
             
     def get(self, X, t):
         _X = np.array(X)
         #print(f'{_X[0]:.1f} {_X[1]:.1f} {np.rad2deg(_X[2]):.1f}')
-        Yref = self.traj.get(t)
-        W = self.wind.sample(t, Yref[0])
-        Xr, Ur, Xrdot = DiffFlatness.state_and_input_from_output(Yref, W, self.ac)
+        ref = None if self.tv_gains is None else self.tv_gains.get(t)
+        if ref is not None and ref[0] is not None: # on the time varying LQR grid
+            Xr, Ur, W = ref[0], ref[1].copy(), None
+        else:
+            Yref = self.traj.get(t)
+            W = self.wind.sample(t, Yref[0])
+            Wdot = wind_rate(self.wind, t, Yref[0], Yref[1])
+            Xr, Ur, Xrdot = DiffFlatness.state_and_input_from_output(Yref, W, self.ac, Wdot)
         U = Ur
         dX = X - Xr
         dX[Aircraft.s_psi] = norm_mpi_pi(dX[Aircraft.s_psi])
         #print(X[Aircraft.s_psi], dX[Aircraft.s_psi])
-        err_sats = np.array([20, 20 , np.pi/3, np.pi/4, 1])
-        dX = np.clip(dX, -err_sats, err_sats)
-        A, B = self.ac.cont_jac(Xr, Ur, t, W)
+        dX = np.clip(dX, -self.err_sats, self.err_sats)
+        A, B = self.ac.cont_jac(Xr, Ur, t, W) if ref is None or self.record else (None, None)
         if 0: # dim 5 feedback
             Q, R = [1, 1, 0.1, 0.01, 0.01,], [8, 1]
             (K, __X, E) = control.lqr(A, B, np.diag(Q), np.diag(R))
             cl_poles, cl_vp =  np.linalg.eig(A-np.dot(B, K))
-        if 1: # dim 3 feedback
+        if ref is not None: # time varying dim 3 feedback
+            K = ref[2]
+            cl_poles = np.linalg.eigvals(A-np.dot(B, K)) if self.record else None
+        elif 1: # dim 3 feedback
             A1,B1 = A[:3,:3], A[:3,3:]
             #Q, R = [1, 1, 0.1], [2, 1]
             #Q, R = [1., 1., 20.], [200, 1000]
-            Q, R = [1., 1., 20.], [500, 2000]
-            (K1, __X, E) = control.lqr(A1, B1, np.diag(Q), np.diag(R))
+            K1 = None if self.gain_table is None else self.gain_table.get(Xr[Aircraft.s_va], Xr[Aircraft.s_phi], Xr[Aircraft.s_psi])
+            if K1 is None:
+                if self.gain_table is not None: self.n_fallback += 1
+                (K1, __X, E) = control.lqr(A1, B1, np.diag(self.Q), np.diag(self.R))
             K=np.zeros((2,5))
             K[:,:3]=K1
-            cl_poles, cl_vp =  np.linalg.eig(A1-np.dot(B1, K1))
-            cl_poles, cl_vp =  np.linalg.eig(A-np.dot(B, K))
+            cl_poles = np.linalg.eigvals(A-np.dot(B, K)) if self.record else None
         if 0: # debuging
             vr, psir, phir = Xr[Aircraft.s_va], Xr[Aircraft.s_psi], Xr[Aircraft.s_phi] 
             A2 = np.array([[0, 0, -vr*np.sin(psir)], [0, 0, vr*np.cos(psir)], [0, 0, 0]])
@@ -112,10 +248,12 @@ class DFFFController:
         dU = -np.dot(K, dX)
         if not self.disable_feedback: U += dU
         #phisat, vmin, vmax = np.deg2rad(30), 9, 15
-        phisat, vmin, vmax = np.deg2rad(45), 9, 15
-        U = np.clip(U, [-phisat, vmin], [phisat, vmax])
+        U = np.clip(U, [-self.phisat, self.vmin], [self.phisat, self.vmax])
         #print(valp2, K, U1, U)
-        if self.record:
+        self.cur_Xref, self.cur_K = Xr, K # last reference and gain, for streaming
+        if self.recorder is not None:
+            self.recorder.append(t=t, X=X, Xref=Xr, K=K, U=U, fb_poles=np.asarray(cl_poles, dtype=complex))
+        elif self.record:
             self.t.append(t)
             self.X.append(X)
             self.Xref.append(Xr)
@@ -124,27 +262,113 @@ class DFFFController:
             self.fb_poles.append(cl_poles)
         return U
 
+    def snapshot(self):
+        return {'records': snapshot_records(self, ['t', 'X', 'Xref', 'K', 'U', 'fb_poles']),
+                'n_recorded': None if self.recorder is None else self.recorder.n}
+
+    def restore(self, snap):
+        restore_records(self, snap['records'])
+        if self.recorder is not None: self.recorder.truncate(snap['n_recorded'])
+
+    def records(self, k): # recorded field k, from the lists or the recorder
+        return np.array(getattr(self, k)) if self.recorder is None else self.recorder[k]
+
     def draw_debug(self, _f=None, _a=None):
         #Xref = np.array(self.Xref)
         #_a[0,0].plot(time, Xref[:,0])
         _f = plt.figure(tight_layout=True, figsize=[16., 9.]) if _f is None else _f
         _a = _f.subplots(5, 1) if _a is None else _a
-        for _p in self.fb_poles:
+        for _p in self.records('fb_poles'):
             _a[0].plot(_p.real, _p.imag, '.')
         _a[0].set_title('cl poles')
-        dts = np.diff(self.t)
+        dts = np.diff(self.records('t'))
         _a[1].hist(dts)
         _a[1].set_title('timing')
 
-        K = np.array(self.K)
+        K = self.records('K')
         _a[2].plot(K[:,0,0])
         _a[2].plot(K[:,0,1])
         _a[2].set_title('gains')
 
-        U = np.array(self.U)
+        U = self.records('U')
         _a[3].plot(np.rad2deg(U[:,0]))
         _a[4].plot(U[:,1])
 
+
+#
+# DFFFController for a whole fleet: (N, s_size) states in, (N, i_size) inputs out, with the same per aircraft outputs.
+# References are sampled by chunks of the control grid (Trajectory.get_batch), the flatness inverse, jacobians,
+# gains (lqr_batch warm started from the previous tick, or LQRGainTable) and saturations are vectorized over aircraft.
+#
+class FleetDFFFController:
+    def __init__(self, trajs, aircrafts, wind, record=False, scheduled=False, chunk=1.):
+        self.trajs, self.aircrafts, self.wind = trajs, aircrafts, wind
+        self.fleet = ddyn.Fleet(aircrafts)
+        self.dt, self.n_chunk = 0.01, max(1, int(round(chunk/0.01)))
+        self._t0, self._Ys = 0., np.zeros((0, len(trajs), Trajectory.nder+1, Trajectory.ncomp))
+        self.recorder = record if isinstance(record, d2rec.RingRecorder) else None
+        self.record = self.recorder is not None or record
+        if self.record and self.recorder is None: self.t, self.X, self.Xref, self.U = [], [], [], []
+        self.Q, self.R = [1., 1., 20.], [500, 2000]
+        self.err_sats = np.array([20, 20 , np.pi/3, np.pi/4, 1])
+        self.phisat, self.vmin, self.vmax = np.deg2rad(45), 9, 15
+        self.gain_table = gain_table(self.Q, self.R, Aircraft.g) if scheduled else None
+        self.K1, self.n_fallback = None, 0
+
+    def __len__(self): return len(self.trajs)
+
+    def references(self, t): # (N, nder+1, ncomp) flat outputs
+        f = (t-self._t0)/self.dt
+        k = int(round(f))
+        if abs(f-k) > 1e-6: return np.array([traj.get(t) for traj in self.trajs]) # off the grid
+        if not 0 <= k < len(self._Ys):
+            self._t0, k = t, 0
+            ts = t + self.dt*np.arange(self.n_chunk)
+            self._Ys = np.stack([traj.get_batch(ts) for traj in self.trajs], axis=1)
+        return self._Ys[k]
+
+    def get(self, X, t):
+        Ys = self.references(t)
+        W = self.wind.sample(t, Ys[:, 0, 0], Ys[:, 0, 1])
+        Wdot = wind_rates(self.wind, t, Ys)
+        U, Uunsat = self.feedback(X, Ys, W, Wdot)
+        if self.recorder is not None: self.recorder.append(t=t, X=X, Xref=self.cur_Xref, U=U)
+        elif self.record:
+            self.t.append(t); self.X.append(np.array(X)); self.Xref.append(self.cur_Xref); self.U.append(U)
+        return U
+
+    def feedback(self, X, Ys, W, Wdot=(0., 0.), update_gains=True): # returns saturated and unsaturated inputs
+        # gains are warm started from the previous ones, or held when update_gains is False
+        Xr, Ur, Xrdot = DiffFlatness.state_and_input_from_outputs(Ys, W, self.fleet, Wdot)
+        dX = X - Xr
+        dX[:, Aircraft.s_psi] = norm_mpi_pi(dX[:, Aircraft.s_psi])
+        dX = np.clip(dX, -self.err_sats, self.err_sats)
+        if update_gains or self.K1 is None:
+            self.K1 = self.gains(Xr)
+        U = Ur - np.einsum('nij,nj->ni', self.K1, dX[:, :3])
+        self.cur_Xref = Xr
+        return np.clip(U, [-self.phisat, self.vmin], [self.phisat, self.vmax]), U
+
+    def gains(self, Xr): # (N, i_size, 3) dim 3 feedback gains
+        if self.gain_table is not None:
+            K1, ok = self.gain_table.get_batch(Xr[:, Aircraft.s_va], Xr[:, Aircraft.s_phi], Xr[:, Aircraft.s_psi])
+            if np.all(ok): return K1
+            self.n_fallback += np.count_nonzero(~ok)
+            A, B = ddyn.cont_jacs(Xr[~ok], self.fleet.tau_phi[~ok], self.fleet.tau_v[~ok], self.fleet.g)
+            K1[~ok] = lqr_batch(A[:, :3, :3], A[:, :3, 3:], self.Q, self.R)
+            return K1
+        A, B = ddyn.cont_jacs(Xr, self.fleet.tau_phi, self.fleet.tau_v, self.fleet.g)
+        K0 = self.K1 if self.K1 is not None and len(self.K1) == len(Xr) else None
+        return lqr_batch(A[:, :3, :3], A[:, :3, 3:], self.Q, self.R, K0=K0)
+
+    def snapshot(self):
+        return {'records': snapshot_records(self, ['t', 'X', 'Xref', 'U']), 'K1': self.K1,
+                'n_recorded': None if self.recorder is None else self.recorder.n}
+
+    def restore(self, snap):
+        restore_records(self, snap['records']); self.K1 = snap['K1']
+        if self.recorder is not None: self.recorder.truncate(snap['n_recorded'])
+
         
 #breakpoint()
         
@@ -196,15 +420,17 @@ class PurePursuitControler:
         self.ref_pos, self.carrot = [], []
         self.vel_ctl = VelControler()
         self.control_vel = False#True
-        self.record = record
-        if self.record:
+        # record: True for lists, or a recorder.RingRecorder (that also takes ref_pos and carrot)
+        self.recorder = record if isinstance(record, d2rec.RingRecorder) else None
+        self.record = self.recorder is not None or record
+        if self.record and self.recorder is None:
             self.t, self.X, self.Xref, self.K, self.U = [], [], [], [], []
         print('dfctl init')
         
     def get(self, X, t):
         dists = np.linalg.norm(self.pts_2d-X[:ddyn.Aircraft.s_y+1], axis=1)
         idx_closest = np.argmin(dists)
-        self.ref_pos.append(self.pts_2d[idx_closest])
+        if self.record and self.recorder is None: self.ref_pos.append(self.pts_2d[idx_closest])
         t0, t1 = self.time[idx_closest], t
         tself = self.time[idx_closest]
 
@@ -219,7 +445,7 @@ class PurePursuitControler:
         phi, v = 0., 12.
         Xref = [xref, yref, psiref, phi, v]
 
-        self.carrot.append(carrot)
+        if self.record and self.recorder is None: self.carrot.append(carrot)
         pc = carrot-X[ddyn.Aircraft.s_slice_pos]
         err_psi = norm_mpi_pi(X[2] - np.arctan2(pc[1], pc[0]))
         K= 0.2 #1.#0.2
@@ -227,7 +453,10 @@ class PurePursuitControler:
         phi_sp = np.clip(phi_sp, -self.sat_phi, self.sat_phi)
         v_sp = self.vel_ctl.get(tself, t) if self.control_vel else 12.
         U = [phi_sp, v_sp]
-        if self.record:
+        self.cur_Xref, self.cur_K = Xref, K
+        if self.recorder is not None:
+            self.recorder.append(t=t, X=X, Xref=Xref, K=K, U=U, ref_pos=self.pts_2d[idx_closest], carrot=carrot)
+        elif self.record:
             self.t.append(t)
             self.X.append(X)
             #print(X, self.X)
@@ -236,5 +465,18 @@ class PurePursuitControler:
             self.U.append(U)
         return  U
 
+    def snapshot(self):
+        return {'sum_err': self.vel_ctl.sum_err,
+                'records': snapshot_records(self, ['t', 'X', 'Xref', 'K', 'U', 'ref_pos', 'carrot']),
+                'n_recorded': None if self.recorder is None else self.recorder.n}
+
+    def restore(self, snap):
+        self.vel_ctl.sum_err = snap['sum_err']
+        restore_records(self, snap['records'])
+        if self.recorder is not None: self.recorder.truncate(snap['n_recorded'])
+
+    def records(self, k):
+        return np.array(getattr(self, k)) if self.recorder is None else self.recorder[k]
+
     
 
@@ -0,0 +1,157 @@
+import os, sys, hashlib, importlib.util, importlib.metadata
+import numpy as np
+
+#
+# Aircraft model, written once with sympy, and the numeric kernels generated from it:
+#  dyn(X, U, W, tau_phi, tau_v, g) -> Xdot
+#  jac(X, U, W, tau_phi, tau_v, g) -> A, B
+#  flatness(Ys, W, Wdot, tau_phi, tau_v, g) -> X, U, Xdot  (inverse of the flat output Ys = (x, y) and its 3 derivatives)
+# Kernels are batched: arrays carry their components on the last axis(es), every argument broadcasts.
+# dyn1, jac1 and flatness1 are the single point versions, for scalar parameters.
+# Common subexpressions are eliminated and the generated module is cached on disk, keyed by this file.
+#
+version = 1 # bump when the code generation changes
+cache_dir = os.path.join(os.path.dirname(__file__), '__pycache__', 'kernels')
+
+def symbols():
+    import sympy as sym
+    X = sym.symbols('x y psi phi va')  # same order as dynamic.Aircraft s_x .. s_va
+    U = sym.symbols('phi_c v_c')        # dynamic.Aircraft i_phi, i_va
+    W = sym.symbols('wx wy')
+    P = sym.symbols('tau_phi tau_v g', positive=True)
+    return X, U, W, P
+
+def dyn_exprs():
+    import sympy as sym
+    (x, y, psi, phi, va), (phi_c, v_c), (wx, wy), (tau_phi, tau_v, g) = symbols()
+    return sym.Matrix([va*sym.cos(psi)+wx,
+                       va*sym.sin(psi)+wy,
+                       g/va*sym.tan(phi),
+                       -(phi-phi_c)/tau_phi,
+                       -(va-v_c)/tau_v])
+
+def jac_exprs():
+    X, U, W, P = symbols()
+    f = dyn_exprs()
+    return f.jacobian(X), f.jacobian(U)
+
+def flatness_exprs():
+    # the wind second derivative along the trajectory is neglected
+    import sympy as sym
+    X, U, (wx, wy), (tau_phi, tau_v, g) = symbols()
+    Ys = sym.Matrix(4, 2, sym.symbols('x y xd yd xdd ydd xddd yddd'))
+    wxd, wyd = sym.symbols('wxd wyd')
+    vax, vay, vaxd, vayd = sym.symbols('vax vay vaxd vayd')
+    va = sym.sqrt(vax**2+vay**2)
+    psid = (vayd*vax-vaxd*vay)/va**2
+    vad = (vax*vaxd+vay*vayd)/va
+    phi = sym.atan(va*psid/g)
+    rates = {vax:vaxd, vay:vayd, vaxd:Ys[3, 0], vayd:Ys[3, 1]}
+    phid = sum([sym.diff(phi, _q)*_qd for _q, _qd in rates.items()])
+    Xr = sym.Matrix([Ys[0, 0], Ys[0, 1], sym.atan2(vay, vax), phi, va])
+    Ur = sym.Matrix([tau_phi*phid+phi, tau_v*vad+va])
+    Xrdot = sym.Matrix([Ys[1, 0], Ys[1, 1], psid, phid, vad])
+    air = {vax:Ys[1, 0]-wx, vay:Ys[1, 1]-wy, vaxd:Ys[2, 0]-wxd, vayd:Ys[2, 1]-wyd}
+    return Ys, (wxd, wyd), [_M.subs(air) for _M in (Xr, Ur, Xrdot)]
+
+
+#
+# Code generation
+#
+def _function(name, args, outputs):
+    # args: (argument name, symbols on its last axes or None for a scalar parameter), outputs: sympy matrices
+    import sympy as sym
+    from sympy.printing.numpy import NumPyPrinter
+    printer = NumPyPrinter({'fully_qualified_modules': True})
+    exprs = [_e for _M in outputs for _e in _M]
+    subs, reduced = sym.cse(exprs, symbols=sym.numbered_symbols('_c'), optimizations='basic')
+    used = set().union(*[_e.free_symbols for _e in exprs]) # only the components needed are unpacked
+    lines, shapes = [f'def {name}({", ".join([_a for _a, _s in args])}):'], []
+    for _a, _s in args:
+        if _s is None:
+            lines.append(f'    {_a} = numpy.asarray({_a}, dtype=float)')
+            shapes.append(f'{_a}.shape'); continue
+        _s = sym.Matrix(_s)
+        lines.append(f'    {_a} = numpy.asarray({_a}, dtype=float)')
+        shapes.append(f'{_a}.shape[:-{len(_s.shape) if _s.shape[1] > 1 else 1}]')
+        for (i, j), _v in np.ndenumerate(np.array(_s, dtype=object)):
+            if _v in used: lines.append(f'    {_v} = {_a}[..., {i}, {j}]' if _s.shape[1] > 1 else f'    {_v} = {_a}[..., {i}]')
+    lines.append(f'    _shape = numpy.broadcast_shapes({", ".join(shapes)})')
+    for _v, _e in subs: lines.append(f'    {_v} = {printer.doprint(_e)}')
+    k, names = 0, []
+    for n, _M in enumerate(outputs):
+        names.append(f'_o{n}')
+        shape = _M.shape if _M.shape[1] > 1 else _M.shape[:1]
+        lines.append(f'    _o{n} = numpy.zeros(_shape+{shape})')
+        for (i, j), _e in np.ndenumerate(np.array(_M, dtype=object)):
+            _r = reduced[k]; k += 1
+            if _r != 0: lines.append(f'    _o{n}[..., {i}{f", {j}" if len(shape) > 1 else ""}] = {printer.doprint(_r)}')
+    lines.append(f'    return {", ".join(names)}')
+    return '\n'.join(lines)+'\n'
+
+def _function_1(name, args, outputs):
+    # same as _function for a single point (sequences in, arrays out), with the math module: much less overhead on scalars
+    import sympy as sym
+    from sympy.printing.pycode import PythonCodePrinter
+    printer = PythonCodePrinter({'fully_qualified_modules': True})
+    exprs = [_e for _M in outputs for _e in _M]
+    subs, reduced = sym.cse(exprs, symbols=sym.numbered_symbols('_c'), optimizations='basic')
+    lines = [f'def {name}({", ".join([_a for _a, _s in args])}):']
+    for _a, _s in args:
+        if _s is None: continue
+        _s = sym.Matrix(_s)
+        if _s.shape[1] == 1: lines.append(f'    {", ".join(map(str, _s))} = {_a}')
+        else: lines += [f'    {", ".join(map(str, _s.row(i)))} = {_a}[{i}]' for i in range(_s.shape[0])]
+    for _v, _e in subs: lines.append(f'    {_v} = {printer.doprint(_e)}')
+    k, names = 0, []
+    for n, _M in enumerate(outputs):
+        vals = [printer.doprint(_r) if _r != 0 else '0.' for _r in reduced[k:k+len(_M)]]; k += len(_M)
+        rows = [f'[{", ".join(vals[i*_M.shape[1]:(i+1)*_M.shape[1]])}]' for i in range(_M.shape[0])]
+        names.append(f'numpy.array([{", ".join(rows)}])' if _M.shape[1] > 1 else f'numpy.array([{", ".join(vals)}])')
+    lines.append(f'    return {", ".join(names)}')
+    return '\n'.join(lines)+'\n'
+
+def generate():
+    X, U, W, P = symbols()
+    params = [(str(_p), None) for _p in P]
+    Ys, Wdot, flat = flatness_exprs()
+    src = '# generated by d2d.kernels, do not edit\nimport math, numpy\n'
+    for name, args, outputs in [('dyn', [('X', X), ('U', U), ('W', W)]+params, [dyn_exprs()]),
+                                ('jac', [('X', X), ('U', U), ('W', W)]+params, list(jac_exprs())),
+                                ('flatness', [('Ys', Ys), ('W', W), ('Wdot', Wdot)]+params, flat)]:
+        src += '\n' + _function(name, args, outputs) + '\n' + _function_1(name+'1', args, outputs)
+    return src
+
+def key():
+    with open(__file__, 'rb') as f: src = f.read()
+    return hashlib.sha256(src + f'{version} {importlib.metadata.version("sympy")}'.encode()).hexdigest()[:16]
+
+def load(dirname=None):
+    # generated module, from the disk cache when possible (sympy is only imported on misses)
+    filename = os.path.join(dirname or cache_dir, f'd2d_kernels_{key()}.py')
+    if not os.path.exists(filename):
+        src = generate()
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            _tmp = f'{filename}.{os.getpid()}.tmp'
+            with open(_tmp, 'w') as f: f.write(src)
+            os.replace(_tmp, filename)
+        except OSError: # read only install, kept in memory
+            module = type(sys)('d2d_kernels'); exec(compile(src, '<d2d_kernels>', 'exec'), module.__dict__)
+            return module
+    spec = importlib.util.spec_from_file_location('d2d_kernels', filename)
+    module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)
+    return module
+
+_kernels = None
+def kernels():
+    global _kernels
+    if _kernels is None: _kernels = load()
+    return _kernels
+
+def dyn(X, U, W, tau_phi, tau_v, g=9.81): return kernels().dyn(X, U, W, tau_phi, tau_v, g)
+def jac(X, U, W, tau_phi, tau_v, g=9.81): return kernels().jac(X, U, W, tau_phi, tau_v, g)
+def flatness(Ys, W, Wdot, tau_phi, tau_v, g=9.81): return kernels().flatness(Ys, W, Wdot, tau_phi, tau_v, g)
+def dyn1(X, U, W, tau_phi, tau_v, g=9.81): return kernels().dyn1(X, U, W, tau_phi, tau_v, g)
+def jac1(X, U, W, tau_phi, tau_v, g=9.81): return kernels().jac1(X, U, W, tau_phi, tau_v, g)
+def flatness1(Ys, W, Wdot, tau_phi, tau_v, g=9.81): return kernels().flatness1(Ys, W, Wdot, tau_phi, tau_v, g)
@@ -0,0 +1,118 @@
+import time as _time
+import numpy as np
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.simulation as dsim
+import d2d.wind as d2w
+from d2d.dynamic import Aircraft
+
+#
+# Monte Carlo robustness evaluation of the DFFF controller:
+# all realizations of a scenario (runs x aircraft) are simulated together as one fleet,
+# and controlled by a guidance.FleetDFFFController (batched flatness, linearization and LQR).
+#
+
+class RunWinds:
+    # wind felt by the n_runs*nv aircraft: the scenario field along their positions (aircraft k flies scenario
+    # aircraft k % nv and feels its dryden gusts, if any), a constant offset per run and optional extra turbulence
+    def __init__(self, field, nv, dW, gusts=None):
+        self.field, self.dW, self.gusts = field, dW, gusts
+        self.acs = np.arange(len(dW)) % nv
+
+    def sample_batch(self, t, locs, turbulence=True):
+        if isinstance(self.field, d2w.DrydenField): W = self.field.mean + self.field.gust(t, self.acs)
+        else: W = self.field.sample_batch(t, locs)
+        W = W + self.dW
+        return W + self.gusts.gust(t) if turbulence and self.gusts is not None else W
+
+class Results:
+    # per run and aircraft metrics, (n_runs, n_aircraft) arrays
+    def __init__(self, n_runs, nv):
+        self.err_mean, self.err_max, self.err_final, self.sat_time = [np.zeros((n_runs, nv)) for i in range(4)]
+        self.X = None # (T, n_runs, nv, s_size) history when requested
+
+    def summarize(self):
+        n_runs, nv = self.err_mean.shape
+        r = f'{n_runs} runs x {nv} aircraft ({n_runs*nv} aircraft trajectories), {self.elapsed:.1f}s ({n_runs/self.elapsed:.1f} runs/s)\n'
+        r += '                 mean    p50    p95    max\n'
+        for name, v in [('err mean (m)', self.err_mean), ('err max (m)', self.err_max),
+                        ('err final (m)', self.err_final), ('saturation (s)', self.sat_time)]:
+            r += f'{name:15s} {np.mean(v):6.2f} {np.percentile(v, 50):6.2f} {np.percentile(v, 95):6.2f} {np.max(v):6.2f}\n'
+        return r
+
+
+class MonteCarlo:
+    # sig_X0: std of the initial state errors, sig_w: std of the (constant) wind offset added to the scenario field
+    # the scenario field keeps its structure (grid, dryden gusts): it is sampled along every run, the controller
+    # getting it along the references, like guidance.DFFFController
+    # n_perts perturbations per aircraft with std sig_pert, at uniformly distributed times
+    # sig_turb, L_turb: dryden turbulence intensity and scale length, felt by the aircraft but unknown to the controller
+    def __init__(self, scen, n_runs, seed=0, sig_X0=(5., 5., np.deg2rad(10), np.deg2rad(5), 1.), sig_w=2.,
+                 n_perts=1, sig_pert=(5., 5., 0., 0., 0.), sig_turb=0., L_turb=100.):
+        self.scen, self.n_runs, self.nv = scen, n_runs, len(scen.trajs)
+        self.sig_X0, self.sig_w = np.asarray(sig_X0), sig_w
+        self.sig_turb, self.L_turb = sig_turb, L_turb
+        self.n_perts, self.sig_pert = n_perts, np.asarray(sig_pert)
+        # one independent stream per run, so a run does not depend on how many are drawn
+        self.seeds = np.random.SeedSequence(seed).spawn(n_runs)
+        self.draw()
+
+    def draw(self):
+        time, nv = self.scen.time, self.nv
+        self.X0s = np.zeros((self.n_runs, nv, Aircraft.s_size))
+        self.Ws = np.zeros((self.n_runs, nv, 2))
+        self.perts = dsim.PertSchedule()
+        self.turb_seeds = np.zeros((self.n_runs, nv), dtype=np.int64)
+        for i, seed in enumerate(self.seeds):
+            rng = np.random.default_rng(seed)
+            self.X0s[i] = self.scen.X0s + rng.normal(size=(nv, Aircraft.s_size))*self.sig_X0
+            self.Ws[i] = rng.normal(size=(nv, 2))*self.sig_w # offsets to the scenario field
+            for j in range(nv):
+                for t, dX in zip(rng.uniform(time[0], time[-1], self.n_perts),
+                                 rng.normal(size=(self.n_perts, Aircraft.s_size))*self.sig_pert):
+                    self.perts.add(t, i*nv+j, dX)
+            self.turb_seeds[i] = rng.integers(2**62, size=nv)
+        for t, ac, dX in self.scen.perts.events: # scenario perturbations are applied to every run
+            for i in range(self.n_runs): self.perts.add(t, i*nv+ac, dX)
+
+    def run(self, integrator='zoh', substeps=1, gain_period=None, keep_history=False, datalink=None):
+        # runs and aircraft are flattened into a single fleet of n_runs*nv
+        # gain_period: LQR gains are recomputed at that period instead of every step
+        # datalink: sensors.Datalink for n_runs*nv aircraft, the controller then gets the decoded telemetry
+        # (its random stream is shared by all runs)
+        time, nv, N = self.scen.time, self.nv, self.n_runs*self.nv
+        acs = [self.scen.aircrafts[j] for i in range(self.n_runs) for j in range(nv)]
+        fleet, dW, field = ddyn.Fleet(acs), self.Ws.reshape(N, 2), self.scen.windfield
+        gusts = None
+        if self.sig_turb > 0: # gusts are in the field frame, whatever the mean wind of the run
+            gusts = d2w.DrydenField(time, N, sigma=self.sig_turb, L=self.L_turb, seeds=self.turb_seeds.ravel())
+        ctl = ddg.FleetDFFFController([self.scen.trajs[j] for i in range(self.n_runs) for j in range(nv)], acs, None)
+        winds = RunWinds(field, nv, dW, gusts)
+        res = Results(self.n_runs, nv)
+        if keep_history: res.X = np.zeros((len(time), N, Aircraft.s_size))
+        err_sum, err_max, sat = np.zeros(N), np.zeros(N), np.zeros(N)
+        X, perts = self.X0s.reshape(N, Aircraft.s_size).copy(), self.perts.cursor(time[0])
+        _start, t_gains = _time.perf_counter(), -np.inf
+        Yrefs = np.stack([traj.get_batch(time) for traj in self.scen.trajs], axis=1) # (T, nv, nder+1, 2)
+        for i, t in enumerate(time):
+            if i > 0:
+                X = fleet.disc_dyn(X, U, winds, time[i-1], t-time[i-1], integrator, substeps)
+                for ac, dX in perts.pop(t): X[ac] += dX
+            Yref = np.tile(Yrefs[i], (self.n_runs, 1, 1)) # run-major, like the fleet
+            update_gains = gain_period is None or t >= t_gains + gain_period - 1e-9
+            if update_gains: t_gains = t
+            Xm = X if datalink is None else datalink.step(t, X, winds.sample_batch(t, X[:, Aircraft.s_slice_pos], False))
+            Wr = field.sample(t, Yref[:, 0, 0], Yref[:, 0, 1]) + dW # controller side, along the references
+            U, Uunsat = ctl.feedback(Xm, Yref, Wr, ddg.wind_rates(field, t, Yref), update_gains=update_gains)
+            err = np.linalg.norm(X[:, Aircraft.s_slice_pos]-Yref[:, 0], axis=1)
+            err_sum += err; err_max = np.maximum(err_max, err)
+            if i < len(time)-1: sat += np.any(U != Uunsat, axis=1)*(time[i+1]-t)
+            if keep_history: res.X[i] = X
+        res.elapsed = _time.perf_counter() - _start
+        res.err_mean[:] = (err_sum/len(time)).reshape(self.n_runs, nv)
+        res.err_max[:] = err_max.reshape(self.n_runs, nv)
+        res.err_final[:] = err.reshape(self.n_runs, nv)
+        res.sat_time[:] = sat.reshape(self.n_runs, nv)
+        if keep_history: res.X = res.X.reshape(len(time), self.n_runs, nv, Aircraft.s_size)
+        return res
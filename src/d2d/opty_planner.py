@@ -116,7 +116,7 @@ class Planner:
         self.sol_v   = self.solution[self._slice_v]
         
     def save_solution(self, filename):
-        wind = np.array([self.wind.sample_num(_t, _x, _y) for _t, _x, _y in zip(self.sol_time, self.sol_x, self.sol_y)])
+        wind = self.wind.sample(self.sol_time, self.sol_x, self.sol_y)
         np.savez(filename, sol_time=self.sol_time, sol_x=self.sol_x, sol_y=self.sol_y,
                  sol_psi=self.sol_psi, sol_phi=self.sol_phi, sol_v=self.sol_v, wind=wind)
         print('saved {}'.format(filename))
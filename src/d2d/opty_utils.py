@@ -4,6 +4,8 @@ import collections
 
 import opty.direct_collocation
 import d2d.ploting as d2p
+import d2d.wind as d2w
+import d2d.kernels as d2k
 
 #
 #  Misc stuff
@@ -71,10 +73,7 @@ def random_states(rng, nac, xlim=(-50, 50), ylim=(-50, 50), v=12.):
 
 
 # Wind
-class WindField:
-   def __init__(self, w=[0.,0.]):
-      self.w = w
-        
+class WindField(d2w.UniformWindField): # legacy (t, x, y) scalar and symbolic sampling
    def sample_sym(self, _t, _x, _y):
       return self.w
     
@@ -91,16 +90,12 @@ class Aircraft:
         self._input_symbols = (self._sv, self._sphi)
 
     def get_eom(self, atm, g=9.81):
+        # kinematics from d2d.kernels, with speed and bank as inputs
         wx, wy = atm.sample_sym(self._st, self._sx(self._st), self._sy(self._st))
-        if 1:
-            eq1 = self._sx(self._st).diff() - self._sv(self._st) * sym.cos(self._spsi(self._st)) + wx
-            eq2 = self._sy(self._st).diff() - self._sv(self._st) * sym.sin(self._spsi(self._st)) + wy
-            eq3 = self._spsi(self._st).diff() - g / self._sv(self._st) * sym.tan(self._sphi(self._st))
-        else: # constant speed attempt
-            eq1 = self._sx(self._st).diff() - self._sv * sym.cos(self._spsi(self._st)) + wx
-            eq2 = self._sy(self._st).diff() - self._sv * sym.sin(self._spsi(self._st)) + wy
-            eq3 = self._spsi(self._st).diff() - g / self._sv * sym.tan(self._sphi(self._st))
-        return sym.Matrix([eq1, eq2, eq3])
+        (x, y, psi, phi, va), U, (_wx, _wy), (tau_phi, tau_v, _g) = d2k.symbols()
+        f = d2k.dyn_exprs()[:3, :].subs({x:self._sx(self._st), y:self._sy(self._st), psi:self._spsi(self._st),
+                                         va:self._sv(self._st), phi:self._sphi(self._st), _wx:wx, _wy:wy, _g:g})
+        return sym.Matrix([_s.diff() for _s in self._state_symbols]) - f
 
 # Symbols for one dimension 5 aircraft (time, state, input)
 class Aircraft5d:
@@ -111,17 +106,18 @@ class Aircraft5d:
       self._input_symbols = (self._sv_sp, self._sphi_sp)
 
    def get_eom(self, atm, g=9.81, tau_v=3., tau_phi=1.):
+      # d2d.kernels model, with the planner time constants
       wx, wy = atm.sample_sym(self._st, self._sx(self._st), self._sy(self._st))
-      eq1 = self._sx(self._st).diff() - self._sv(self._st) * sym.cos(self._spsi(self._st)) + wx
-      eq2 = self._sy(self._st).diff() - self._sv(self._st) * sym.sin(self._spsi(self._st)) + wy
-      eq3 = self._spsi(self._st).diff() - g / self._sv(self._st) * sym.tan(self._sphi(self._st))
-      eq4 = self._sv(self._st).diff() + 1./tau_v*(self._sv(self._st)-self._sv_sp(self._st))
-      eq5 = self._sphi(self._st).diff() + 1./tau_phi*(self._sphi(self._st)-self._sphi_sp(self._st))
-      return sym.Matrix([eq1, eq2, eq3, eq4, eq5])
+      (x, y, psi, phi, va), (phi_c, v_c), (_wx, _wy), (_tau_phi, _tau_v, _g) = d2k.symbols()
+      f = d2k.dyn_exprs().subs({x:self._sx(self._st), y:self._sy(self._st), psi:self._spsi(self._st),
+                                va:self._sv(self._st), phi:self._sphi(self._st),
+                                phi_c:self._sphi_sp(self._st), v_c:self._sv_sp(self._st),
+                                _wx:wx, _wy:wy, _tau_phi:tau_phi, _tau_v:tau_v, _g:g})
+      f = f.extract([0, 1, 2, 4, 3], [0]) # state symbols order: x, y, psi, v, phi
+      return sym.Matrix([_s.diff() for _s in self._state_symbols]) - f
 
    
 
-
 # Cost functions
 class CostAirVel: # constant air velocity
     def __init__(self, vsp=10.):
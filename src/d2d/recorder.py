@@ -0,0 +1,143 @@
+import os, struct
+import numpy as np
+
+#
+# Streaming of simulation results to disk
+#
+# Each recorded field is an appendable .npy file: a fixed size header that is rewritten with the
+# current number of rows at every flush, followed by the raw rows. Files can hence be opened with
+# np.load(..., mmap_mode='r') while being written, and read back lazily.
+#
+
+class NpyAppender:
+    _header_size = 128 # bytes, magic included, large enough for any row count
+
+    def __init__(self, filename, row_shape=(), dtype=np.float64):
+        self.filename, self.row_shape, self.dtype = filename, tuple(row_shape), np.dtype(dtype)
+        self.nrows = 0
+        self._f = open(filename, 'wb')
+        self._write_header()
+
+    def _write_header(self):
+        shape = (self.nrows,) + self.row_shape
+        d = f"{{'descr': {np.lib.format.dtype_to_descr(self.dtype)!r}, 'fortran_order': False, 'shape': {shape!r}, }}"
+        hlen = self._header_size - 10
+        header = d.ljust(hlen-1).encode('latin1') + b'\n'
+        if len(header) != hlen: raise ValueError(f'header too long for {self.filename}')
+        self._f.seek(0)
+        self._f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', hlen) + header)
+        self._f.seek(0, os.SEEK_END)
+
+    def append(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape((-1,)+self.row_shape)
+        self._f.write(rows.tobytes())
+        self.nrows += len(rows)
+        self._write_header()
+        self._f.flush()
+
+    def close(self):
+        if not self._f.closed: self._f.close()
+
+
+class ChunkedWriter:
+    # buffers rows in fixed size chunks, written to dirname/<field>.npy when full
+    # fields are created on the first append, from the shapes of the provided values
+    def __init__(self, dirname, chunk_size=1024, dtype=np.float64):
+        self.dirname, self.chunk_size, self.dtype = dirname, chunk_size, dtype
+        os.makedirs(dirname, exist_ok=True)
+        self._bufs, self._files, self._n = {}, {}, 0
+
+    def append(self, **values):
+        if not self._bufs:
+            for k, v in values.items():
+                shape = np.shape(v)
+                self._bufs[k] = np.zeros((self.chunk_size,)+shape, dtype=self.dtype)
+                self._files[k] = NpyAppender(os.path.join(self.dirname, f'{k}.npy'), shape, self.dtype)
+        for k, v in values.items():
+            self._bufs[k][self._n] = v
+        self._n += 1
+        if self._n == self.chunk_size: self.flush()
+
+    def flush(self):
+        for k, buf in self._bufs.items():
+            self._files[k].append(buf[:self._n])
+        self._n = 0
+
+    def close(self):
+        self.flush()
+        for f in self._files.values(): f.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *args): self.close()
+
+
+#
+# Bounded history of per tick records, eg controllers in long real time sessions.
+# Each field is a preallocated typed ring buffer of depth rows, created on the first append from the provided values.
+# Buffers are mirrored (every row is written twice, at i and i+depth) so that the last rows are always a contiguous
+# slice: view() is zero copy. dtype applies to all fields but the ones in dtypes, complex values get the matching
+# complex type. With spill, rows about to be overwritten are first written by chunks to spill/<field>.npy (NpyAppender),
+# which with close() holds the whole history. Without it they are dropped.
+#
+class RingRecorder:
+    def __init__(self, depth=4096, dtype=np.float64, spill=None, chunk=None, dtypes={'t': np.float64}):
+        self.chunk = max(1, depth//4) if chunk is None else chunk
+        if depth % self.chunk: raise ValueError(f'depth {depth} is not a multiple of chunk {self.chunk}')
+        self.depth, self.dtype, self.spill, self.dtypes = depth, np.dtype(dtype), spill, dtypes
+        if spill is not None: os.makedirs(spill, exist_ok=True)
+        self._bufs, self._files = {}, {}
+        self.n, self.n_spilled = 0, 0 # rows appended, rows written (or dropped)
+
+    def _create(self, k, v):
+        v = np.asarray(v)
+        dtype = np.dtype(self.dtypes.get(k, self.dtype))
+        if np.iscomplexobj(v): dtype = np.result_type(dtype, np.complex64)
+        self._bufs[k] = np.zeros((2*self.depth,)+v.shape, dtype=dtype)
+
+    def append(self, **values):
+        if not self._bufs:
+            for k, v in values.items(): self._create(k, v)
+        if self.n - self.n_spilled == self.depth: self._spill(self.chunk)
+        i = self.n % self.depth
+        for k, v in values.items(): self._bufs[k][i::self.depth] = v # both mirrored rows
+        self.n += 1
+
+    def _spill(self, m): # writes (or drops) the m oldest unspilled rows
+        i = self.n_spilled % self.depth
+        if self.spill is not None:
+            for k, buf in self._bufs.items():
+                if k not in self._files:
+                    self._files[k] = NpyAppender(os.path.join(self.spill, f'{k}.npy'), buf.shape[1:], buf.dtype)
+                self._files[k].append(buf[i:i+m])
+        self.n_spilled += m
+
+    def __len__(self): return min(self.n, self.depth)
+    def __contains__(self, k): return k in self._bufs
+    def keys(self): return self._bufs.keys()
+
+    def view(self, k, n=None):
+        # the last n (default all kept) rows of field k, oldest first, valid until the next append
+        n = len(self) if n is None else min(n, len(self))
+        i = (self.n-n) % self.depth
+        return self._bufs[k][i:i+n]
+
+    def __getitem__(self, k): return self.view(k)
+
+    def truncate(self, n):
+        # rolls back to the first n appended rows, eg on checkpoint restore, as long as they are still in memory
+        if not max(self.n_spilled, self.n-self.depth) <= n <= self.n:
+            raise ValueError(f'can not truncate to {n} rows: {self.n_spilled} spilled, {len(self)} kept out of {self.n}')
+        self.n = n
+
+    def close(self):
+        if self.n > self.n_spilled: self._spill(self.n-self.n_spilled)
+        for f in self._files.values(): f.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *args): self.close()
+
+
+def load(dirname):
+    # returns a dictionnary of read only memory mapped arrays, nothing is loaded until accessed
+    return {fn[:-4]: np.load(os.path.join(dirname, fn), mmap_mode='r')
+            for fn in sorted(os.listdir(dirname)) if fn.endswith('.npy')}
@@ -4,6 +4,8 @@ import d2d.trajectory as ddt
 import d2d.trajectory_factory as ddtf
 import d2d.guidance as d2guid
 import d2d.dynamic as d2dyn
+import d2d.simulation as d2sim
+import d2d.wind as d2w
 from d2d.dynamic import Aircraft
 
 #
@@ -32,8 +34,8 @@ class Scenario:
             self.time = np.arange(0., tf, _default_dt)
         try: self.aircrafts
         except AttributeError: self.aircrafts = [Aircraft() for i in range(nv)]
-        try: self.perts
-        except AttributeError: self.perts=[np.zeros((len(self.time), Aircraft.s_size)) for i in range(nv)]
+        try: self.perts = d2sim.as_schedule(self.perts, self.time) # dense arrays are still accepted
+        except AttributeError: self.perts = d2sim.PertSchedule()
         try: self.windfield
         except AttributeError: self.windfield = d2guid.WindField()
         try: self.X0s
@@ -41,8 +43,8 @@ class Scenario:
             self.X0s = []
             for ac, traj in zip(self.aircrafts, self.trajs):
                 t0 = self.time[0]; Yr = traj.get(t0)
-                W = self.windfield.sample(t0, Yr[0])
-                self.X0s.append(d2guid.DiffFlatness.state_and_input_from_output(Yr, W, ac)[0])
+                W, Wdot = self.windfield.sample(t0, Yr[0]), d2guid.wind_rate(self.windfield, t0, Yr[0], Yr[1])
+                self.X0s.append(d2guid.DiffFlatness.state_and_input_from_output(Yr, W, ac, Wdot)[0])
         try: self.extends
         except AttributeError: 
             self.extends = (0., 100., 0., 100.)
@@ -51,6 +53,11 @@ class Scenario:
         except AttributeError:
             self.ppctl = False
             
+    def set_dt(self, dt):
+        # resample the scenario time grid, perturbations are applied at the first new sample at or after their time
+        t0, tf = self.time[0], self.time[-1] + (self.time[-1]-self.time[-2])
+        self.time = np.arange(t0, tf, dt)
+
     def autoscale(self):
         pmin, pmax = (float('inf'), float('inf')), (-float('inf'), -float('inf'))
         for traj in self.trajs:
@@ -80,8 +87,7 @@ class ScenLine(Scenario):
         self.windfield = d2guid.WindField()
         self.time = np.arange(0, 12., 0.01)
         self.X0s = [[10, 10, 0, 0, 10]]
-        self.perts = [np.zeros((len(self.time), d2dyn.Aircraft.s_size))]
-        self.perts[0][600,d2dyn.Aircraft.s_y]  =  10
+        self.perts = d2sim.PertSchedule([(6., 0, {d2dyn.Aircraft.s_y: 10})])
         Scenario.__init__(self)
 register(ScenLine)
 
@@ -132,12 +138,30 @@ class ScenCircle(Scenario):
                 self.X0s.append(d2guid.DiffFlatness.state_and_input_from_output(Yr, W, ac)[0])
             self.X0s[0][0] += 5.; self.X0s[0][1] += -5.
         if 0:
-            self.perts = [np.zeros((len(self.time), d2dyn.Aircraft.s_size))]
-            self.perts[0][500,d2dyn.Aircraft.s_x]  =  10
-            self.perts[0][1000,d2dyn.Aircraft.s_y] = -10
+            self.perts = d2sim.PertSchedule([( 5., 0, {d2dyn.Aircraft.s_x:  10}),
+                                             (10., 0, {d2dyn.Aircraft.s_y: -10})])
         Scenario.__init__(self)
 register(ScenCircle)
 
+class ScenCircleGust(ScenCircle):
+    name = 'circle_gust'
+    desc = 'circle1 in dryden turbulence'
+    def __init__(self):
+        ScenCircle.__init__(self)
+        self.windfield = d2w.DrydenField(self.time, len(self.trajs), mean=[0., 0.], sigma=1.5)
+register(ScenCircleGust)
+
+class ScenCircleShear(ScenCircle):
+    name = 'circle_shear'
+    desc = 'circle1 in a gridded wind shear'
+    def __init__(self):
+        ScenCircle.__init__(self)
+        xs, ys = np.arange(-60, 160, 10.), np.arange(-60, 160, 10.)
+        W = np.zeros((len(xs), len(ys), 2))
+        W[..., 0], W[..., 1] = 0.1*(ys[None, :]-25), 0.05*(xs[:, None]-25)
+        self.windfield = d2w.GridWindField(xs, ys, W)
+register(ScenCircleShear)
+
 class ScenSquare(Scenario):
     name = 'square'
     desc = 'square'
@@ -0,0 +1,109 @@
+import xml.etree.ElementTree as ET
+import numpy as np
+
+import d2d.utils as d2u
+from d2d.dynamic import Aircraft
+
+#
+# Sensors and datalink emulation: what PprzBackend sees of the aircraft.
+# Telemetry messages are sent periodically by every aircraft, delayed, dropped, noisy and quantized,
+# then decoded into a state estimate the way PprzAircraft.get_state does it (GPS course and ground speed
+# stand for heading and airspeed). All aircraft are processed at once.
+#
+
+# message periods (s) of the paparazzi default telemetry (conf/telemetry/default_fixedwing.xml, Ap process)
+default_periods = {'GPS': 0.25, 'ATTITUDE': 0.1}
+
+def telemetry_periods(filename=None, process='Ap', mode='default'):
+    # message periods from a paparazzi telemetry xml file, defaults for the messages it does not list
+    periods = dict(default_periods)
+    if filename is None: return periods
+    for _p in ET.parse(filename).getroot().iter('process'):
+        if _p.get('name') != process: continue
+        for _m in _p.iter('mode'):
+            if _m.get('name') != mode: continue
+            for _msg in _m.iter('message'):
+                if _msg.get('name') in periods: periods[_msg.get('name')] = float(_msg.get('period'))
+    return periods
+
+
+class Message:
+    # fields: decoded state components, sigmas: noise std, quanta: resolution of the telemetry fields
+    def __init__(self, name, period, fields, sigmas, quanta):
+        self.name, self.period, self.fields = name, period, np.array(fields)
+        self.sigmas, self.quanta = np.array(sigmas, dtype=float), np.array(quanta, dtype=float)
+
+def gps_msg(period, sig_pos=0.5, sig_speed=0.1, sig_course=np.deg2rad(1.)):
+    # utm position in cm, speed in cm/s, course in decideg
+    return Message('GPS', period, [Aircraft.s_x, Aircraft.s_y, Aircraft.s_psi, Aircraft.s_va],
+                   [sig_pos, sig_pos, sig_course, sig_speed], [0.01, 0.01, np.deg2rad(0.1), 0.01])
+
+def attitude_msg(period, sig_phi=np.deg2rad(0.5)):
+    return Message('ATTITUDE', period, [Aircraft.s_phi], [sig_phi], [0.])
+
+def true_measurements(msg, X, W):
+    # noiseless values of the message fields for (n, s_size) states and (n, 2) winds
+    if msg.name == 'GPS':
+        gvx = X[:, Aircraft.s_va]*np.cos(X[:, Aircraft.s_psi]) + W[:, 0]
+        gvy = X[:, Aircraft.s_va]*np.sin(X[:, Aircraft.s_psi]) + W[:, 1]
+        return np.stack([X[:, Aircraft.s_x], X[:, Aircraft.s_y], np.arctan2(gvy, gvx), np.hypot(gvx, gvy)], axis=-1)
+    return X[:, msg.fields]
+
+
+class Datalink:
+    # latency: mean and std (s) of the transport delay, drop: probability of a message being lost
+    def __init__(self, n_ac, periods=None, latency=(0.05, 0.02), drop=0.02, seed=0, msgs=None):
+        periods = default_periods if periods is None else periods
+        self.msgs = msgs if msgs is not None else [gps_msg(periods['GPS']), attitude_msg(periods['ATTITUDE'])]
+        self.n_ac, self.latency, self.drop = n_ac, latency, drop
+        self.rng = np.random.default_rng(seed)
+        self.Xm = None # decoded state, (n_ac, s_size)
+
+    def reset(self, t0, X0):
+        self.Xm = np.array(X0, dtype=float)
+        for msg in self.msgs:
+            msg.next = t0 + self.rng.uniform(0, msg.period, self.n_ac) # aircraft are not synchronized
+            msg.q_t, msg.q_ac, msg.q_v, msg.q_ts = np.zeros(0), np.zeros(0, dtype=int), np.zeros((0, len(msg.fields))), np.zeros(0)
+            msg.stamp = np.full(self.n_ac, t0) # emission time of the last decoded message
+            msg.sent, msg.dropped, msg.received = 0, 0, 0
+
+    def send(self, msg, t, X, W):
+        idx = np.flatnonzero(t >= msg.next-1e-9)
+        if len(idx) == 0: return
+        msg.next[idx] += msg.period*np.floor((t-msg.next[idx])/msg.period+1)
+        v = true_measurements(msg, X[idx], W[idx]) + self.rng.normal(size=(len(idx), len(msg.fields)))*msg.sigmas
+        q = msg.quanta > 0
+        v[:, q] = np.round(v[:, q]/msg.quanta[q])*msg.quanta[q]
+        keep = self.rng.uniform(size=len(idx)) >= self.drop
+        lat = np.maximum(0., self.rng.normal(self.latency[0], self.latency[1], len(idx)))
+        msg.sent += len(idx); msg.dropped += np.sum(~keep)
+        msg.q_t = np.concatenate((msg.q_t, t+lat[keep])); msg.q_ac = np.concatenate((msg.q_ac, idx[keep]))
+        msg.q_v = np.concatenate((msg.q_v, v[keep])); msg.q_ts = np.concatenate((msg.q_ts, np.full(np.sum(keep), t)))
+
+    def receive(self, msg, t):
+        arrived = msg.q_t <= t+1e-9
+        if not np.any(arrived): return
+        order = np.argsort(msg.q_t[arrived], kind='stable') # later arrivals overwrite earlier ones
+        ac, v, ts = msg.q_ac[arrived][order], msg.q_v[arrived][order], msg.q_ts[arrived][order]
+        self.Xm[ac[:, None], msg.fields] = v
+        msg.stamp[ac] = ts
+        msg.received += len(ac)
+        msg.q_t, msg.q_ac, msg.q_v, msg.q_ts = msg.q_t[~arrived], msg.q_ac[~arrived], msg.q_v[~arrived], msg.q_ts[~arrived]
+
+    def step(self, t, X, W):
+        # X: true states (n_ac, s_size), W: winds at the aircraft (n_ac, 2), returns the decoded states
+        if self.Xm is None: self.reset(t, X)
+        for msg in self.msgs:
+            self.send(msg, t, X, W)
+            self.receive(msg, t)
+        self.Xm[:, Aircraft.s_psi] = d2u.norm_mpi_pi(self.Xm[:, Aircraft.s_psi])
+        return self.Xm.copy()
+
+    def age(self, t): # age of the decoded data, per message and aircraft
+        return {msg.name: t - msg.stamp for msg in self.msgs}
+
+    def summarize(self):
+        r = ''
+        for msg in self.msgs:
+            r += f'{msg.name:9s} {1/msg.period:5.1f}Hz sent {msg.sent} dropped {msg.dropped} received {msg.received} pending {len(msg.q_t)}\n'
+        return r
@@ -0,0 +1,161 @@
+import os, hashlib, types, uuid, importlib
+import numpy as np
+
+import d2d.simulation as dsim
+import d2d.wind as d2w
+
+#
+# Content addressed cache of closed loop simulations, one entry per aircraft.
+# The key is a hash of everything the run depends on (controller - which holds the trajectory,
+# aircraft, wind and gains -, initial state, perturbations, time grid and integrator),
+# entries are npz files evicted in least recently used order when the cache grows too big.
+#
+
+version = 1 # bump when the cache format changes, the simulation code is part of the key (code_key)
+code_modules = ['d2d.dynamic', 'd2d.guidance', 'd2d.simulation', 'd2d.wind', 'd2d.trajectory', 'd2d.trajectory_factory',
+                'd2d.scenario', 'd2d.utils']
+
+_code_key = None
+def code_key():
+    # hash of the sources the results depend on, and of the generated kernels
+    global _code_key
+    if _code_key is None:
+        import d2d.kernels as d2k
+        h = hashlib.sha256(d2k.key().encode())
+        for m in code_modules:
+            with open(importlib.import_module(m).__file__, 'rb') as f: h.update(f.read())
+        _code_key = h.hexdigest()
+    return _code_key
+
+def fingerprint(obj, h=None, _seen=None):
+    # sha256 of the content of obj: numbers, strings, arrays, containers and objects (through their attributes)
+    top, h, _seen = h is None, h or hashlib.sha256(), _seen if _seen is not None else set()
+    if isinstance(obj, np.ndarray):
+        h.update(f'nd{obj.dtype}{obj.shape}'.encode()); h.update(np.ascontiguousarray(obj).tobytes())
+    elif obj is None or isinstance(obj, (bool, int, float, complex, str, bytes, np.generic)):
+        h.update(f'{type(obj).__name__}:{obj!r}'.encode())
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'['); [fingerprint(_o, h, _seen) for _o in obj]; h.update(b']')
+    elif isinstance(obj, dict):
+        h.update(b'{')
+        for k in sorted(obj, key=str): fingerprint(k, h, _seen); fingerprint(obj[k], h, _seen)
+        h.update(b'}')
+    elif isinstance(obj, (set, frozenset)):
+        h.update(b'set'); fingerprint(sorted(obj, key=repr), h, _seen)
+    elif isinstance(obj, types.CodeType):
+        h.update(b'code'); h.update(obj.co_code); fingerprint([obj.co_consts, obj.co_names], h, _seen)
+    elif isinstance(obj, type):
+        # classes are hashed with the code of their methods (along the mro), classes defined outside code_modules included
+        h.update(f'class:{obj.__module__}.{obj.__qualname__}'.encode())
+        if id(obj) not in _seen: # methods using super() capture their class
+            _seen.add(id(obj))
+            for _k in obj.__mro__[:-1]:
+                methods = {}
+                for _n, _v in vars(_k).items():
+                    _f = _v.fget if isinstance(_v, property) else getattr(_v, '__func__', _v)
+                    if isinstance(_f, types.FunctionType): methods[_n] = _f
+                fingerprint([_k.__qualname__, methods], h, _seen)
+            _seen.discard(id(obj))
+    elif callable(obj) and not hasattr(obj, '__dict__') and not isinstance(obj, types.MethodType):
+        h.update(f'callable:{getattr(obj, "__module__", "")}.{getattr(obj, "__qualname__", repr(obj))}'.encode())
+    elif id(obj) in _seen:
+        h.update(b'<cycle>')
+    elif isinstance(obj, (types.FunctionType, types.MethodType)):
+        # names are not enough (lambdas, nested functions): code, defaults and captured values are hashed
+        _seen.add(id(obj))
+        if isinstance(obj, types.MethodType): h.update(b'method'); fingerprint([obj.__func__, obj.__self__], h, _seen)
+        else:
+            cells = []
+            for _c in obj.__closure__ or ():
+                try: cells.append(_c.cell_contents)
+                except ValueError: cells.append('<empty>')
+            h.update(f'function:{obj.__module__}.{obj.__qualname__}'.encode())
+            fingerprint([obj.__code__, obj.__defaults__, obj.__kwdefaults__, cells], h, _seen)
+        _seen.discard(id(obj))
+    else:
+        _seen.add(id(obj)) # objects being hashed, shared (non cyclic) references are hashed each time
+        h.update(b'obj'); fingerprint(type(obj), h, _seen)
+        state = obj.__getstate__() if hasattr(obj, '__getstate__') else getattr(obj, '__dict__', repr(obj))
+        fingerprint(getattr(obj, '__dict__', repr(obj)) if state is None else state, h, _seen)
+        _seen.discard(id(obj))
+    return h.hexdigest() if top else h
+
+def run_key(time, aircraft, windfield, ctl, X0, perts, integrator, substeps):
+    return fingerprint([version, code_key(), time, aircraft, windfield, ctl, np.asarray(X0, dtype=float),
+                        dsim.as_schedule(perts, time), integrator, substeps])
+
+
+class SimCache:
+    def __init__(self, dirname='cache/sim', max_bytes=512*2**20):
+        self.dirname, self.max_bytes = dirname, max_bytes
+        os.makedirs(dirname, exist_ok=True)
+        self.hits, self.misses = 0, 0
+
+    def filename(self, key): return os.path.join(self.dirname, key+'.npz')
+
+    def run_simulation(self, time, aircraft, windfield, ctl, X0, perts, integrator='odeint', substeps=1):
+        # same as simulation.run_simulation, the controller records (if any) are restored on cache hits
+        key = run_key(time, aircraft, windfield, ctl, X0, perts, integrator, substeps)
+        filename = self.filename(key)
+        try:
+            with np.load(filename) as data:
+                X, U, Yref = data['X'], data['U'], data['Yref']
+                recs = {k[4:]:data[k] for k in data.files if k.startswith('rec_')}
+            os.utime(filename) # mtime is the LRU clock
+            if getattr(ctl, 'record', False):
+                for k, v in recs.items(): setattr(ctl, k, list(v))
+            self.hits += 1
+            return X, U, Yref
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            pass
+        self.misses += 1
+        lens = {k:len(v) for k, v in vars(ctl).items() if isinstance(v, list)} if getattr(ctl, 'record', False) else {}
+        X, U, Yref = dsim.run_simulation(time, aircraft, windfield, ctl, X0, perts, integrator, substeps)
+        recs = {}
+        for k, n in lens.items(): # lists filled during the run
+            v = getattr(ctl, k)
+            if len(v) > n:
+                try: recs['rec_'+k] = np.array(v)
+                except ValueError: continue # ragged
+                if recs['rec_'+k].dtype == object: del recs['rec_'+k]
+        _tmp = f'{filename[:-4]}.{os.getpid()}.{uuid.uuid4().hex}.tmp.npz' # one per writer
+        np.savez(_tmp, X=X, U=U, Yref=Yref, **recs)
+        os.replace(_tmp, filename) # readers never see partial files
+        self.evict()
+        return X, U, Yref
+
+    def simulate_scenario(self, scen, ctls, integrator='odeint', substeps=1, aircrafts=None):
+        # per aircraft lookup: only the aircraft whose inputs changed are simulated
+        Xs, Us, Yrefs = [], [], []
+        aircrafts = scen.aircrafts if aircrafts is None else aircrafts
+        for i, (ac, ctl, X0, pert) in enumerate(zip(aircrafts, ctls, scen.X0s, scen.perts.split(len(ctls)))):
+            windfield = d2w.for_aircraft(scen.windfield, i)
+            X, U, Yref = self.run_simulation(scen.time, ac, windfield, ctl, X0, pert, integrator, substeps)
+            Xs.append(X); Us.append(U); Yrefs.append(Yref)
+        return Xs, Us, Yrefs
+
+    def entries(self): # (mtime, size, filename), oldest first
+        es = []
+        for f in os.listdir(self.dirname):
+            if not f.endswith('.npz') or f.endswith('.tmp.npz'): continue
+            try: st = os.stat(os.path.join(self.dirname, f))
+            except FileNotFoundError: continue
+            es.append((st.st_mtime, st.st_size, os.path.join(self.dirname, f)))
+        return sorted(es)
+
+    def size(self): return sum([_e[1] for _e in self.entries()])
+
+    def evict(self):
+        es = self.entries()
+        total = sum([_e[1] for _e in es])
+        for mtime, size, f in es:
+            if total <= self.max_bytes: break
+            try: os.remove(f)
+            except FileNotFoundError: pass
+            total -= size
+
+    def clear(self):
+        for _e in self.entries(): os.remove(_e[2])
+
+    def summarize(self):
+        return f'{self.dirname}: {len(self.entries())} entries, {self.size()/2**20:.1f}MB, {self.hits} hits, {self.misses} misses'
@@ -0,0 +1,283 @@
+import pickle, bisect
+import numpy as np, scipy.integrate
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.utils as d2u
+import d2d.wind as d2w
+
+#
+# Perturbations: sorted list of (time, aircraft, state delta), applied to the state
+# of the first simulation sample at or after their time.
+#
+class PertSchedule:
+    def __init__(self, events=()):
+        self.events = sorted([self._event(t, ac, dX) for t, ac, dX in events], key=self._key)
+
+    @classmethod
+    def from_dense(cls, time, perts): # perts: one (len(time), s_size) array per aircraft
+        events = []
+        for ac, pert in enumerate(perts):
+            pert = np.asarray(pert)
+            events += [(time[i], ac, pert[i]) for i in np.flatnonzero(np.any(pert != 0, axis=1))]
+        return cls(events)
+
+    @staticmethod
+    def _key(e): return e[0], e[1]
+
+    @staticmethod
+    def _event(t, ac, dX): # dX is a state vector or a {state_index: value} dictionnary
+        if isinstance(dX, dict):
+            _dX = np.zeros(ddyn.Aircraft.s_size)
+            for k, v in dX.items(): _dX[k] = v
+            dX = _dX
+        return float(t), int(ac), np.array(dX, dtype=float)
+
+    def add(self, t, ac, dX): # kept sorted, after the events with the same time and aircraft
+        bisect.insort(self.events, self._event(t, ac, dX), key=self._key)
+
+    def __len__(self): return len(self.events)
+
+    def times(self): return np.array([_e[0] for _e in self.events])
+
+    def for_aircraft(self, ac): # events of one aircraft, renumbered as aircraft 0
+        return PertSchedule([(t, 0, dX) for t, _ac, dX in self.events if _ac == ac])
+
+    def split(self, n): return [self.for_aircraft(i) for i in range(n)]
+
+    def cursor(self, t0): return PertCursor(self, t0)
+
+class PertCursor: # walks a schedule along the simulation, events at or before t0 are considered already applied
+    def __init__(self, sched, t0):
+        self.events, self.i = sched.events, 0
+        self.pop(t0)
+
+    def pop(self, t): # events due at t, as a list of (aircraft, state delta)
+        due = []
+        while self.i < len(self.events) and self.events[self.i][0] <= t+1e-9:
+            due.append(self.events[self.i][1:]); self.i += 1
+        return due
+
+def as_schedule(perts, time):
+    # accepts a schedule, None, or the legacy dense format (one array, or a list of arrays, of shape (len(time), s_size))
+    if isinstance(perts, PertSchedule): return perts
+    if perts is None: return PertSchedule()
+    if np.ndim(perts[0]) == 1: perts = [perts]
+    return PertSchedule.from_dense(time, perts)
+
+#
+# Closed loop simulations
+#
+
+def run_simulation(time, aircraft, windfield, ctl, X0, perts, integrator='odeint', substeps=1):
+    X,U = np.zeros((len(time), ddyn.Aircraft.s_size)), np.zeros((len(time), ddyn.Aircraft.i_size))
+    Yref = np.array([ctl.traj.get(t) for t in time])
+    X[0] = X0
+    perts = as_schedule(perts, time).cursor(time[0])
+    for i in range(1, len(time)):
+        U[i-1] = ctl.get(X[i-1], time[i-1])#, time)
+        X[i] = aircraft.disc_dyn(X[i-1], U[i-1], windfield, time[i-1], time[i]-time[i-1], integrator, substeps)
+        for _ac, dX in perts.pop(time[i]): X[i] += dX
+    U[-1] = ctl.get(X[-1], time[-1])
+    return X, U, Yref
+
+#
+# Checkpoints: state of a run before the control computation at sample i.
+# X and U are the arrays of the run they were taken from (shared between checkpoints, only [:i+1] and [:i] are used),
+# the perturbations cursor is not stored: events up to time[i] are part of the history.
+#
+class Checkpoint:
+    def __init__(self, i, time, X, U, ctl_state):
+        self.i, self.t, self.time, self.X, self.U, self.ctl_state = i, time[i], time, X, U, ctl_state
+
+def controller_snapshot(ctl): # controllers without internal state don't need to implement snapshot
+    try: return ctl.snapshot()
+    except AttributeError: return None
+
+def run_simulation_checkpointed(time, aircraft, windfield, ctl, X0, perts, ckpt_period=10., integrator='odeint', substeps=1,
+                                resume=None):
+    # same as run_simulation, with checkpoints every ckpt_period seconds, returns X, U, Yref, checkpoints
+    # resume: checkpoint to start from, controller, perturbations (after the checkpoint) and wind may differ from its run
+    X, U = np.zeros((len(time), ddyn.Aircraft.s_size)), np.zeros((len(time), ddyn.Aircraft.i_size))
+    if resume is None:
+        i0, X[0] = 0, X0
+    else:
+        i0 = resume.i
+        if len(resume.time) != len(time) or abs(resume.time[i0]-time[i0]) > 1e-9:
+            raise ValueError('resuming on a different time grid')
+        X[:i0+1], U[:i0] = resume.X[:i0+1], resume.U[:i0]
+        if resume.ctl_state is not None: ctl.restore(resume.ctl_state)
+    perts = as_schedule(perts, time).cursor(time[i0])
+    ckpts, t_ckpt = [], -np.inf
+    for i in range(i0, len(time)):
+        if i > i0:
+            X[i] = aircraft.disc_dyn(X[i-1], U[i-1], windfield, time[i-1], time[i]-time[i-1], integrator, substeps)
+            for _ac, dX in perts.pop(time[i]): X[i] += dX
+        if time[i] >= t_ckpt + ckpt_period - 1e-9:
+            ckpts.append(Checkpoint(i, time, X, U, controller_snapshot(ctl))); t_ckpt = time[i]
+        U[i] = ctl.get(X[i], time[i])
+    Yref = np.array([ctl.traj.get(t) for t in time])
+    return X, U, Yref, ckpts
+
+def find_checkpoint(ckpts, t): # last checkpoint at or before t
+    ckpts = [_c for _c in ckpts if _c.t <= t+1e-9]
+    return ckpts[-1] if ckpts else None
+
+def save_checkpoints(filename, ckpts):
+    with open(filename, 'wb') as f: pickle.dump(ckpts, f) # shared arrays and records are stored once
+
+def load_checkpoints(filename):
+    with open(filename, 'rb') as f: return pickle.load(f)
+
+def run_simulation_streamed(time, aircraft, windfield, ctl, X0, perts, writer, integrator='odeint', substeps=1):
+    # same as run_simulation, but every step is sent to writer (see d2d.recorder) instead of being kept in memory
+    # (ctl should be created with record=False)
+    X = np.array(X0, dtype=float)
+    perts = as_schedule(perts, time).cursor(time[0])
+    for i, t in enumerate(time):
+        if i > 0:
+            X = aircraft.disc_dyn(X, U, windfield, time[i-1], t-time[i-1], integrator, substeps)
+            for _ac, dX in perts.pop(t): X += dX
+        U = np.asarray(ctl.get(X, t))
+        writer.append(t=t, X=X, U=U, Yref=ctl.traj.get(t), Xref=ctl.cur_Xref, K=ctl.cur_K)
+    return X
+
+#
+# Multi rate simulation: plant on the time grid, other tasks at their own period and phase
+#
+class Task:
+    def __init__(self, name, period, phase, callback):
+        self.name, self.period, self.phase, self.callback = name, period, phase, callback
+        self.count, self.next_t = 0, None
+
+class Scheduler:
+    def __init__(self, tasks=()):
+        self.tasks = list(tasks)
+
+    def add(self, name, period, callback, phase=0.):
+        self.tasks.append(Task(name, period, phase, callback))
+
+    def reset(self, t0):
+        for task in self.tasks: task.count, task.next_t = 0, t0+task.phase
+
+    def step(self, t, X, U): # runs the tasks that are due at t, callbacks are called with (t, X, U)
+        for task in self.tasks:
+            if t >= task.next_t-1e-9:
+                task.callback(t, X, U)
+                task.count += 1
+                while task.next_t <= t+1e-9: task.next_t += task.period
+
+    def summarize(self):
+        return ' '.join([f'{task.name}: {task.count}' for task in self.tasks])
+
+class Telemetry: # records the state at the task rate
+    def __init__(self): self.t, self.X, self.U = [], [], []
+    def __call__(self, t, X, U): self.t.append(t); self.X.append(np.array(X)); self.U.append(np.array(U))
+
+def run_multirate_simulation(time, aircraft, windfield, ctl, X0, perts, ctl_period=0.1, ctl_phase=0.,
+                             sched=None, integrator='odeint', substeps=1):
+    # the controller is run every ctl_period (zero order hold in between), extra tasks (telemetry, display...)
+    # can be provided in sched, and their activation counts checked afterwards
+    sched = sched or Scheduler()
+    X,U = np.zeros((len(time), ddyn.Aircraft.s_size)), np.zeros((len(time), ddyn.Aircraft.i_size))
+    Yref = np.array([ctl.traj.get(t) for t in time])
+    def _ctl_cb(t, _X, _U): _U[:] = ctl.get(_X, t)
+    sched.tasks = [Task('control', ctl_period, ctl_phase, _ctl_cb)] + [_t for _t in sched.tasks if _t.name != 'control']
+    sched.reset(time[0])
+    X[0], Uk = X0, np.zeros(ddyn.Aircraft.i_size)
+    perts = as_schedule(perts, time).cursor(time[0])
+    if ctl_phase > 0: Uk[:] = ctl.get(X[0], time[0]) # no command is available before the first update
+    for i in range(len(time)):
+        if i > 0:
+            X[i] = aircraft.disc_dyn(X[i-1], U[i-1], windfield, time[i-1], time[i]-time[i-1], integrator, substeps)
+            for _ac, dX in perts.pop(time[i]): X[i] += dX
+        sched.step(time[i], X[i], Uk)
+        U[i] = Uk
+    return X, U, Yref
+
+def hold_records(ts, values, time):
+    # records of a controller called at ts (eg every ctl_dt), zero order held on time, the first value before the first call
+    idx = np.clip(np.searchsorted(ts, np.asarray(time)+1e-9, side='right')-1, 0, len(ts)-1)
+    return np.asarray(values)[idx]
+
+def make_controllers(scen, ppctl=None, record=True):
+    # the scenario control specification, unless ppctl is given
+    ppctl = scen.ppctl if ppctl is None else ppctl
+    if ppctl: return [ddg.PurePursuitControler(traj, record) for traj in scen.trajs]
+    return [ddg.DFFFController(traj, ac, scen.windfield, record) for traj, ac in zip(scen.trajs, scen.aircrafts)]
+
+def simulate_scenario(scen, ppctl=None, integrator='odeint', substeps=1, record=False):
+    # one closed loop simulation per aircraft, returns lists of X, U, Yref
+    ctls = make_controllers(scen, ppctl, record)
+    Xs, Us, Yrefs = [], [], []
+    for i, (ac, ctl, X0, pert) in enumerate(zip(scen.aircrafts, ctls, scen.X0s, scen.perts.split(len(ctls)))):
+        X, U, Yref = run_simulation(scen.time, ac, d2w.for_aircraft(scen.windfield, i), ctl, X0, pert, integrator, substeps)
+        Xs.append(X); Us.append(U); Yrefs.append(Yref)
+    return Xs, Us, Yrefs
+
+def run_fleet_simulation(time, fleet, windfield, ctls, X0s, perts, integrator='odeint', substeps=1, datalink=None):
+    # all aircraft are integrated together, returns lists of per aircraft X, U, Yref
+    # ctls: one controller per aircraft, or a single fleet one (eg guidance.FleetDFFFController)
+    # datalink: when given (see sensors.Datalink), controllers get the decoded telemetry instead of the true states
+    n = len(fleet)
+    if hasattr(ctls, 'trajs'): get_inputs = lambda Xs, t: ctls.get(Xs, t)
+    else: get_inputs = lambda Xs, t: [ctl.get(_X, t) for ctl, _X in zip(ctls, Xs)]
+    X = np.zeros((len(time), n, ddyn.Aircraft.s_size))
+    U = np.zeros((len(time), n, ddyn.Aircraft.i_size))
+    X[0] = X0s
+    perts = as_schedule(perts, time).cursor(time[0])
+    def measure(i):
+        if datalink is None: return X[i]
+        return datalink.step(time[i], X[i], ddyn.sample_winds(windfield, time[i], X[i, :, ddyn.Aircraft.s_slice_pos]))
+    for i in range(1, len(time)):
+        U[i-1] = get_inputs(measure(i-1), time[i-1])
+        X[i] = fleet.disc_dyn(X[i-1], U[i-1], windfield, time[i-1], time[i]-time[i-1], integrator, substeps)
+        for ac, dX in perts.pop(time[i]): X[i, ac] += dX
+    U[-1] = get_inputs(measure(-1), time[-1])
+    trajs = ctls.trajs if hasattr(ctls, 'trajs') else [ctl.traj for ctl in ctls]
+    Yrefs = [traj.get_batch(time) for traj in trajs]
+    return [X[:,j] for j in range(n)], [U[:,j] for j in range(n)], Yrefs
+
+
+def get_events(time, ctl, perts, ctl_dt):
+    # times at which the integration is restarted: controller updates, reference breakpoints and perturbations
+    t0, t1 = time[0], time[-1]
+    evts = [np.arange(t0, t1, ctl_dt) if ctl_dt is not None else [t0]]
+    evts.append(ctl.traj.get_breakpoints(t0, t1))
+    evts.append(perts.times())
+    evts = np.unique(np.concatenate(evts+[[t1]]))
+    return evts[np.concatenate(([True], np.diff(evts) > 1e-9))] # merge coincident events
+
+def run_simulation_adaptive(time, aircraft, windfield, ctl, X0, perts, ctl_dt=0.1, dense=True,
+                            method='RK45', rtol=1e-6, atol=1e-8):
+    # adaptive step integration between events, the controller is sampled at every event (zero order hold in between)
+    # dense: output on time, like run_simulation, otherwise on the solver steps, returning (t, X, U, Yref)
+    perts = as_schedule(perts, time)
+    evts = get_events(time, ctl, perts, ctl_dt)
+    pert_cursor = perts.cursor(time[0])
+    X = np.zeros((len(time), ddyn.Aircraft.s_size)) if dense else [np.asarray(X0, dtype=float)]
+    U = np.zeros((len(time), ddyn.Aircraft.i_size)) if dense else []
+    ts = None if dense else [evts[0]]
+    Xk, i = np.array(X0, dtype=float), 0
+    for ta, tb in zip(evts[:-1], evts[1:]):
+        for _ac, dX in pert_cursor.pop(ta): Xk += dX # perturbations due at the begining of the segment
+        Uk = np.array(ctl.get(Xk, ta))
+        _f = lambda _t, _X: aircraft.cont_dyn(_X, _t, Uk, windfield)
+        sol = scipy.integrate.solve_ivp(_f, (ta, tb), Xk, method=method, rtol=rtol, atol=atol, dense_output=dense)
+        if dense:
+            j = np.searchsorted(time, tb-1e-9)
+            if j > i: X[i:j], U[i:j] = sol.sol(time[i:j]).T, Uk
+            i = j
+        else:
+            ts += list(sol.t[1:]); X += list(sol.y[:, 1:].T); U += [Uk]*(len(sol.t)-1)
+        Xk = sol.y[:, -1]
+        Xk[ddyn.Aircraft.s_psi] = d2u.norm_mpi_pi(Xk[ddyn.Aircraft.s_psi])
+    for _ac, dX in pert_cursor.pop(time[-1]): Xk += dX
+    if dense:
+        X[i:] = Xk; U[i:] = ctl.get(Xk, time[-1])
+    else:
+        U.append(ctl.get(Xk, ts[-1])); X[-1] = Xk
+        time, X, U = np.array(ts), np.array(X), np.array(U)
+    X[:, ddyn.Aircraft.s_psi] = d2u.norm_mpi_pi(X[:, ddyn.Aircraft.s_psi])
+    Yref = np.array([ctl.traj.get(t) for t in time])
+    return (X, U, Yref) if dense else (time, X, U, Yref)
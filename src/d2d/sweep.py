@@ -0,0 +1,107 @@
+import os, signal, itertools, json, time as _time, traceback
+import concurrent.futures
+import numpy as np
+
+import d2d.guidance as ddg
+import d2d.scenario as dds
+import d2d.simulation as dsim
+
+#
+# Headless sweeps: registered scenarios crossed with wind, controller and time step grids,
+# run across a process pool. Jobs are plain dicts, so that they can be sent to the workers
+# and stored along with their results.
+#
+
+class JobTimeout(Exception): pass
+
+def make_jobs(scens, winds=(None,), ctls=('scen',), dts=(None,), integrator='odeint', substeps=1):
+    # winds: (wx, wy) or None for the scenario wind, ctls: 'dfff', 'pp' or 'scen', dts: step or None for the scenario one
+    return [{'scen':_s, 'wind':_w, 'ctl':_c, 'dt':_dt, 'integrator':integrator, 'substeps':substeps}
+            for _s, _w, _c, _dt in itertools.product(scens, winds, ctls, dts)]
+
+def tracking_metrics(time, X, U, Yref, phisat=np.deg2rad(45)):
+    err = np.linalg.norm(X[:, :2]-Yref[:, 0], axis=1)
+    sat = np.abs(U[:-1, 0]) >= phisat-1e-6
+    return {'err_mean':float(np.mean(err)), 'err_max':float(np.max(err)), 'err_final':float(err[-1]),
+            'sat_time':float(np.sum(sat*np.diff(time)))}
+
+def _on_timeout(signum, frame): raise JobTimeout()
+
+def run_job(job, timeout=None):
+    # runs in a worker: never raises, failures and timeouts are reported in the result
+    res, _start = {'job':job, 'status':'ok'}, _time.perf_counter()
+    if timeout is not None:
+        previous = signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        scen, desc = dds.get(job['scen'])
+        if job['wind'] is not None: scen.windfield = ddg.WindField(job['wind']) # initial states are kept
+        if job['dt'] is not None: scen.set_dt(job['dt'])
+        ppctl = {'scen':None, 'dfff':False, 'pp':True}[job['ctl']]
+        Xs, Us, Yrefs = dsim.simulate_scenario(scen, ppctl, job['integrator'], job['substeps'])
+        res['metrics'] = [tracking_metrics(scen.time, X, U, Yref) for X, U, Yref in zip(Xs, Us, Yrefs)]
+        res['X'] = Xs
+    except JobTimeout:
+        res['status'] = 'timeout'
+    except Exception:
+        res['status'], res['error'] = 'failed', traceback.format_exc()
+    finally:
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, signal.SIG_DFL if previous is None else previous)
+    res['elapsed'] = _time.perf_counter() - _start
+    return res
+
+def run_sweep(jobs, n_workers=None, timeout=None, keep_states=False, verbose=True):
+    # returns one result per job, in the order of jobs
+    n_workers = n_workers or os.cpu_count()
+    results, _start = [None]*len(jobs), _time.perf_counter()
+    def collect(i, res):
+        if not keep_states: res.pop('X', None)
+        results[i] = res
+        if verbose:
+            j, k = res['job'], sum([_r is not None for _r in results])
+            print(f"[{k}/{len(jobs)}] {_time.perf_counter()-_start:6.1f}s {j['scen']} wind {j['wind']} ctl {j['ctl']} "
+                  f"dt {j['dt']}: {res['status']} ({res['elapsed']:.1f}s)", flush=True)
+    def died(i): return {'job':jobs[i], 'status':'failed', 'error':traceback.format_exc(), 'elapsed':0.}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = {pool.submit(run_job, job, timeout): i for i, job in enumerate(jobs)}
+        for fut in concurrent.futures.as_completed(futures):
+            i = futures[fut]
+            try: collect(i, fut.result())
+            except concurrent.futures.process.BrokenProcessPool: pass # rerun below
+            except Exception: collect(i, died(i))
+    # a worker died (crash, killed) and broke the pool: its unfinished jobs are rerun one process each,
+    # so that only the faulty one fails
+    pending, running = [i for i, _r in enumerate(results) if _r is None], {}
+    while pending or running:
+        while pending and len(running) < n_workers:
+            i, _pool = pending.pop(0), concurrent.futures.ProcessPoolExecutor(max_workers=1)
+            running[_pool.submit(run_job, jobs[i], timeout)] = (i, _pool)
+        finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for fut in finished:
+            i, _pool = running.pop(fut)
+            try: res = fut.result()
+            except Exception: res = died(i)
+            _pool.shutdown()
+            collect(i, res)
+    return results
+
+def summarize(results):
+    r = ''
+    for res in results:
+        j, status = res['job'], res['status']
+        errs = ' '.join([f"{_m['err_mean']:.2f}" for _m in res.get('metrics', [])])
+        r += f"{j['scen']:12s} {str(j['wind']):12s} {j['ctl']:5s} {str(j['dt']):6s} {status:8s} err mean {errs}\n"
+    n_ok = sum([res['status'] == 'ok' for res in results])
+    return r + f'{n_ok}/{len(results)} jobs succeeded'
+
+def save(filename, results):
+    # metrics go to a json file, states (when kept) to a npz file alongside
+    with open(filename+'.json', 'w') as f:
+        json.dump([{k:v for k, v in res.items() if k != 'X'} for res in results], f, indent=1)
+    states = {f'job_{i}_aircraft_{j}':X for i, res in enumerate(results) for j, X in enumerate(res.get('X', []))}
+    if states: np.savez_compressed(filename+'.npz', **states)
+
+def load(filename):
+    with open(filename+'.json') as f: return json.load(f)
@@ -92,7 +92,9 @@ class Trajectory: # Trajectory base class
     extends = (0, 100, 0, 100)
     def __init__(self): self.t0 = 0.
     def get(self, t): return np.zeros((self.nder+1, self.ncomp))
+    def get_batch(self, ts): return np.array([self.get(t) for t in ts]) # (len(ts), nder+1, ncomp), vectorized in subclasses
     def reset(self, t0): self.t0 = t0
+    def get_breakpoints(self, t0, t1): return [] # times in [t0, t1] where the reference is not smooth
 
     def compute_extends(self, dt = 0.1):
         ts = np.arange(self.t0, self.t0 + self.duration, dt)
@@ -127,6 +129,12 @@ class TrajectoryLine(Trajectory):
         Yc[1,:3] =           self.un*self.v
         return Yc#Yc.T
 
+    def get_batch(self, ts):
+        Yc = np.zeros((len(ts), Trajectory.nder+1, Trajectory.ncomp))
+        Yc[:,0] = self.p1 + self.un*self.v*(np.asarray(ts)-self.t0)[:,None]
+        Yc[:,1] =           self.un*self.v
+        return Yc
+
 class TrajectoryCircle(Trajectory):
     # sign of r specifies direction
     def __init__(self, c=[30., 30.],  r=30., v=10., t0=0., alpha0=0, dalpha=2*np.pi):
@@ -146,6 +154,15 @@ class TrajectoryCircle(Trajectory):
         p3 = self.omega**3*self.r*np.array([ sa, -ca])
         return np.array((p, p1, p2, p3))
 
+    def get_batch(self, ts):
+        alpha = (np.asarray(ts)-self.t0) * self.omega + self.alpha0
+        ca, sa = np.cos(alpha), np.sin(alpha)
+        Yc = np.empty((len(alpha), Trajectory.nder+1, Trajectory.ncomp))
+        Yc[:,0] = self.c+self.r*np.stack([ca, sa], axis=-1)
+        for d, (_c, _s) in enumerate([(-sa, ca), (-ca, -sa), (sa, -ca)], 1):
+            Yc[:,d] = self.omega**d*self.r*np.stack([_c, _s], axis=-1)
+        return Yc
+
 
 
 class MinSnapPoly(Trajectory):
@@ -184,6 +201,16 @@ class CompositeTraj(Trajectory):
 
     def reset(self, t0): self.t0 = t0
 
+    def get_breakpoints(self, t0, t1): # segment switches, including the ones of nested trajectories
+        bps, starts = [], np.concatenate(([0.], self.steps_end[:-1]))
+        k0, k1 = int(np.floor((t0-self.t0)/self.duration)), int(np.ceil((t1-self.t0)/self.duration))
+        for k in range(k0, k1+1):
+            tk = self.t0 + k*self.duration
+            for s, ts, te in zip(self.steps, starts, self.steps_end):
+                bps.append(float(tk+ts))
+                bps += [float(tk+_t) for _t in s.get_breakpoints(ts, te)]
+        return sorted([_t for _t in bps if t0 <= _t <= t1])
+
     def get(self, t):
         dt = t - self.t0
         Yc = np.zeros((5,4))
@@ -192,6 +219,14 @@ class CompositeTraj(Trajectory):
         Yc = self.steps[cur_step].get(dt_lapse)
         return Yc
 
+    def get_batch(self, ts):
+        dt_lapse = np.fmod(np.asarray(ts, dtype=float) - self.t0, self.duration)
+        cur_step = np.argmax(self.steps_end > dt_lapse[:,None], axis=1)
+        Yc = np.zeros((len(dt_lapse), Trajectory.nder+1, Trajectory.ncomp))
+        for k in np.unique(cur_step):
+            Yc[cur_step==k] = self.steps[k].get_batch(dt_lapse[cur_step==k])
+        return Yc
+
 
 # FIXME: in factory
 class TabulatedTraj(Trajectory):
@@ -281,7 +281,7 @@ class TrajSiSpline(ddt.SpaceIndexedTraj):
             flat_out = np.array([self.get(_t) for _t in self.ts]) 
             pos = flat_out[:,0]
             vel_gnd = flat_out[:,1]
-            wind = np.array([windfield.sample(_t, _p) for _t, _p in zip(self.ts, pos)])
+            wind = windfield.sample(self.ts, pos[:,0], pos[:,1])
             vel_air = vel_gnd - wind
             vair = np.linalg.norm(vel_air, axis=1)
             err = np.mean(np.square(vair-vtarget))
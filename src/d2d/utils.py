@@ -4,13 +4,12 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+import d2d.wind as d2w
+
 def norm_mpi_pi(v): return ( v + np.pi) % (2 * np.pi ) - np.pi
 
 
-class WindField:
-    def __init__(self, w=[0.,0.]):
-        self.w = w
-        
+class WindField(d2w.UniformWindField): # legacy (x, y, t) argument order
     def sample_num(self, _x, _y, _t):
         return self.w
 
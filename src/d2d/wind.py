@@ -0,0 +1,231 @@
+import os, copy
+import numpy as np, scipy.signal
+
+#
+# Wind sources for simulation, control and planning
+#
+# One interface: sample(ts, xs, ys) takes arrays of N query points and returns a (N, 2) array
+# (scalars give a (2,) vector). The legacy sample(t, loc) call is recognized when ys is not given, loc must then be a single (2,) location.
+# sample_batch(t, locs) is the fleet entry point: one row per aircraft.
+# Sources implement sample_points(ts, xs, ys), broadcasting its arguments.
+#
+class WindField:
+    def sample(self, ts, xs=None, ys=None):
+        if ys is None: # legacy (t, loc), a single location only: batches go through sample(ts, xs, ys) or sample_batch
+            if np.shape(xs) != (2,): raise ValueError(f'legacy sample(t, loc) expects a (2,) location, got shape {np.shape(xs)}')
+            xs, ys = xs[0], xs[1]
+        return self.sample_points(ts, xs, ys)
+
+    def sample_batch(self, t, locs):
+        locs = np.asarray(locs)
+        return self.sample_points(t, locs[..., 0], locs[..., 1])
+
+class UniformWindField(WindField):
+    def __init__(self, w=[0.,0.]):
+        self.w = w
+    def sample(self, ts, xs=None, ys=None):
+        if ys is None: # legacy (t, loc), returned as is
+            if np.shape(xs) != (2,): raise ValueError(f'legacy sample(t, loc) expects a (2,) location, got shape {np.shape(xs)}')
+            return self.w
+        return self.sample_points(ts, xs, ys)
+    def sample_points(self, ts, xs, ys):
+        shape = np.broadcast_shapes(np.shape(ts), np.shape(xs), np.shape(ys))
+        return np.broadcast_to(np.asarray(self.w, dtype=float), shape+(2,))
+    def summarize(self):
+        return f'{self.w} m/s'
+
+
+#
+# Dryden turbulence: one gust time series per aircraft over the whole time grid,
+# generated in a single filtering pass and sampled by index during the simulation.
+# Frozen turbulence at airspeed V turns the spatial spectra into time ones (tau = L/V),
+# the longitudinal spectrum is applied along the mean wind and the lateral one across it.
+#
+def dryden_filters(sigma, L, V, dt):
+    # discrete (bilinear) longitudinal and lateral filters, scaled for a stationnary std of sigma
+    tau = L/V
+    filters = []
+    for num, den in [([np.sqrt(2*tau/np.pi)], [tau, 1.]),
+                     ([np.sqrt(3)*tau*np.sqrt(tau/np.pi), np.sqrt(tau/np.pi)], [tau**2, 2*tau, 1.])]:
+        b, a = scipy.signal.bilinear(num, den, 1./dt)
+        h = scipy.signal.lfilter(b, a, np.r_[1., np.zeros(int(20*tau/dt))]) # impulse response
+        filters.append((b*sigma/np.sqrt(np.sum(h**2)), a))
+    return filters
+
+class DrydenField(WindField):
+    # time: regular simulation time grid, n: number of aircraft, mean: mean wind (m/s)
+    # sigma: turbulence intensity (m/s), L: turbulence scale length (m), V: nominal airspeed (m/s)
+    # seeds: an int, or one seed (eg SeedSequence) per aircraft for independent reproducible series
+    def __init__(self, time, n, mean=[0., 0.], sigma=1., L=100., V=12., seeds=0, dtype=np.float32):
+        self.t0, self.dt, self.n_t = time[0], time[1]-time[0], len(time)
+        self.mean, self.sigma, self.L, self.V = np.asarray(mean, dtype=float), sigma, L, V
+        self.ac = None # aircraft whose gusts are returned by sample(), mean wind only when None
+        n_burn = int(5*L/V/self.dt) # filters start in their stationnary regime
+        if np.ndim(seeds) == 0:
+            noise = np.random.default_rng(seeds).normal(size=(n, 2, n_burn+self.n_t))
+        else:
+            noise = np.array([np.random.default_rng(_s).normal(size=(2, n_burn+self.n_t)) for _s in seeds])
+        (bu, au), (bv, av) = dryden_filters(sigma, L, V, self.dt)
+        gu = scipy.signal.lfilter(bu, au, noise[:, 0], axis=-1)[:, n_burn:]
+        gv = scipy.signal.lfilter(bv, av, noise[:, 1], axis=-1)[:, n_burn:]
+        norm = np.linalg.norm(self.mean)
+        c, s = (self.mean/norm) if norm > 0 else (1., 0.)
+        self.gusts = np.empty((n, self.n_t, 2), dtype=dtype) # compact storage
+        self.gusts[..., 0], self.gusts[..., 1] = c*gu - s*gv, s*gu + c*gv
+
+    def index(self, t): # sample index and interpolation factor, O(1) on the regular grid
+        f = np.clip((t-self.t0)/self.dt, 0, self.n_t-1)
+        k = np.minimum(int(f), self.n_t-2)
+        return k, f-k
+
+    def gust(self, t, acs=slice(None)):
+        k, a = self.index(t)
+        return (1-a)*self.gusts[acs, k] + a*self.gusts[acs, k+1]
+
+    def sample_points(self, ts, xs, ys): # gusts of aircraft ac (mean wind only without it) at times ts
+        shape = np.broadcast_shapes(np.shape(ts), np.shape(xs), np.shape(ys))
+        if self.ac is None: return np.broadcast_to(self.mean, shape+(2,))
+        f = np.clip((np.broadcast_to(ts, shape)-self.t0)/self.dt, 0, self.n_t-1)
+        k = np.minimum(f.astype(int), self.n_t-2); a = (f-k)[..., None]
+        return self.mean + (1-a)*self.gusts[self.ac, k] + a*self.gusts[self.ac, k+1]
+
+    def sample_batch(self, t, locs): # one row per aircraft
+        return self.mean + self.gust(t, slice(0, len(locs)))
+
+    def for_aircraft(self, ac): # same series, sample() returns the ones of aircraft ac
+        field = copy.copy(self); field.ac = ac
+        return field
+
+    def summarize(self):
+        return f'{self.mean} m/s, dryden {self.sigma} m/s, L {self.L} m, {self.gusts.shape[0]} aircraft'
+
+def for_aircraft(windfield, ac): # per aircraft view of a wind field, when it makes a difference
+    try: return windfield.for_aircraft(ac)
+    except AttributeError: return windfield
+
+
+#
+# Gridded wind maps, eg measured on site: W (nx, ny, 2) on a regular (x, y) grid, or (nt, nx, ny, 2) on a regular (t, x, y) one.
+# Bilinear (trilinear) interpolation, vectorized over query points. Outside the grid the border values are held.
+#
+class GridWindField(WindField):
+    def __init__(self, xs, ys, W, ts=None):
+        self.W = np.asarray(W, dtype=float)
+        if ts is None: self.W = self.W[None] # a single time slice
+        self.axes = [np.asarray(_a, dtype=float) for _a in ([0.] if ts is None else ts, xs, ys)]
+        for _a, _n in zip(self.axes, self.W.shape[:3]):
+            if len(_a) != _n: raise ValueError(f'grid axis of length {len(_a)} for {_n} values')
+            if _n > 1 and not np.allclose(np.diff(_a), _a[1]-_a[0]): raise ValueError('grid axes must be regularly spaced')
+        self.origin = np.array([_a[0] for _a in self.axes])
+        self.step = np.array([_a[1]-_a[0] if len(_a) > 1 else 1. for _a in self.axes])
+        self.mean = np.mean(self.W, axis=(0, 1, 2))
+
+    def _cells(self, ts, xs, ys):
+        # per axis: lower index, fraction, and derivative factor (1/step inside the grid, 0 outside where values are held)
+        cells = []
+        for q, o, d, n in zip(np.broadcast_arrays(ts, xs, ys), self.origin, self.step, self.W.shape[:3]):
+            if n == 1: cells.append((np.zeros(q.shape, dtype=int), np.zeros(q.shape), np.zeros(q.shape))); continue
+            f = (q-o)/d
+            i = np.clip(np.floor(f).astype(int), 0, n-2)
+            a = f-i
+            cells.append((i, np.clip(a, 0, 1), ((a >= 0) & (a <= 1))/d))
+        return cells
+
+    def sample_points(self, ts, xs, ys):
+        # wind at (N,) query points, returns (N, 2)
+        (it, at, _), (ix, ax, _), (iy, ay, _) = self._cells(ts, xs, ys)
+        W, it1 = self.W, np.minimum(it+1, self.W.shape[0]-1)
+        def bilin(i):
+            return (((1-ax)*(1-ay))[..., None]*W[i, ix, iy] + (ax*(1-ay))[..., None]*W[i, ix+1, iy] +
+                    ((1-ax)*ay)[..., None]*W[i, ix, iy+1] + (ax*ay)[..., None]*W[i, ix+1, iy+1])
+        return (1-at)[..., None]*bilin(it) + at[..., None]*bilin(it1)
+
+    def jac_points(self, ts, xs, ys):
+        # derivatives of the wind at (N,) query points, returns (N, 2, 3) as [dW/dx, dW/dy, dW/dt]
+        (it, at, gt), (ix, ax, gx), (iy, ay, gy) = self._cells(ts, xs, ys)
+        W, it1 = self.W, np.minimum(it+1, self.W.shape[0]-1)
+        def grads(i):
+            W00, W10, W01, W11 = W[i, ix, iy], W[i, ix+1, iy], W[i, ix, iy+1], W[i, ix+1, iy+1]
+            val = ((1-ax)*(1-ay))[..., None]*W00 + (ax*(1-ay))[..., None]*W10 + ((1-ax)*ay)[..., None]*W01 + (ax*ay)[..., None]*W11
+            dx = ((1-ay)[..., None]*(W10-W00) + ay[..., None]*(W11-W01))*gx[..., None]
+            dy = ((1-ax)[..., None]*(W01-W00) + ax[..., None]*(W11-W10))*gy[..., None]
+            return val, dx, dy
+        (v0, dx0, dy0), (v1, dx1, dy1) = grads(it), grads(it1)
+        _a = at[..., None]
+        return np.stack([(1-_a)*dx0 + _a*dx1, (1-_a)*dy0 + _a*dy1, (v1-v0)*gt[..., None]], axis=-1)
+
+    def sample_jac(self, t, loc):
+        return self.jac_points(t, loc[0], loc[1])
+
+    def summarize(self):
+        nt, nx, ny = self.W.shape[:3]
+        return f'grid {nx}x{ny}' + (f'x{nt} steps' if nt > 1 else '') + f', mean {self.mean} m/s'
+
+
+#
+# Recorded wind logs, eg estimated on board during flights: (T, 3) rows of (t, wx, wy) in a .npy file.
+# Timestamps must be increasing. The file is memory mapped on first use and only the rows around the query times are read,
+# so hours long logs are replayed without loading them. Linear interpolation, end values are held.
+# offset shifts the log time axis: simulation time t reads the log at t+offset.
+#
+def save_wind_log(filename, ts, W):
+    np.save(filename, np.column_stack((ts, W)).astype(float))
+
+class LoggedWindField(WindField):
+    def __init__(self, filename, offset=0.):
+        self.filename, self.offset = filename, offset
+        self._log = None
+
+    def __getstate__(self): # memory maps are reopened in other processes, the file stamp identifies the content
+        st = os.stat(self.filename)
+        return {'filename':self.filename, 'offset':self.offset, '_log':None, 'stamp':(st.st_size, st.st_mtime_ns)}
+
+    @property
+    def log(self):
+        if self._log is None: self.open()
+        return self._log
+
+    def open(self):
+        self._log = np.load(self.filename, mmap_mode='r')
+        if self._log.ndim != 2 or self._log.shape[1] != 3: raise ValueError(f'{self.filename}: expected (T, 3) rows of (t, wx, wy)')
+        self.n = self._log.shape[0]
+        self.t0, self.t1 = float(self._log[0, 0]), float(self._log[-1, 0])
+        self.dt = (self.t1-self.t0)/(self.n-1) if self.n > 1 else 1.
+        self.uniform = True # until a lookup lands on the wrong rows, the log is never scanned
+
+    def index(self, ts):
+        # lower sample index and interpolation factor: O(1) on a regular log, binary search otherwise
+        log, t = self.log, np.clip(np.asarray(ts, dtype=float)+self.offset, self.t0, self.t1)
+        if self.n == 1: return np.zeros(t.shape, dtype=int), np.zeros(t.shape)
+        if self.uniform:
+            k = np.minimum(((t-self.t0)/self.dt).astype(int), self.n-2)
+            ta, tb = log[k, 0], log[k+1, 0]
+            eps = 1e-9*self.dt
+            if np.all((ta <= t+eps) & (t-eps <= tb)): return k, np.clip((t-ta)/(tb-ta), 0, 1)
+            self.uniform = False
+        k = np.clip(np.searchsorted(log[:, 0], t, side='right')-1, 0, self.n-2)
+        ta, tb = log[k, 0], log[k+1, 0]
+        return k, (t-ta)/(tb-ta)
+
+    def sample_points(self, ts, xs, ys):
+        shape = np.broadcast_shapes(np.shape(ts), np.shape(xs), np.shape(ys))
+        k, a = self.index(np.broadcast_to(ts, shape))
+        k1 = np.minimum(k+1, self.n-1)
+        return (1-a)[..., None]*self.log[k, 1:] + a[..., None]*self.log[k1, 1:]
+
+    def jac_points(self, ts, xs, ys): # (..., 2, 3) [dW/dx, dW/dy, dW/dt], the log has no spatial structure
+        shape = np.broadcast_shapes(np.shape(ts), np.shape(xs), np.shape(ys))
+        ts = np.broadcast_to(np.asarray(ts, dtype=float), shape)
+        J = np.zeros(shape+(2, 3))
+        if self.n < 2: return J
+        k, a = self.index(ts)
+        inside = ((self.t0 <= ts+self.offset) & (ts+self.offset <= self.t1))[..., None] # held outside the log
+        J[..., 2] = np.where(inside, (self.log[k+1, 1:]-self.log[k, 1:])/(self.log[k+1, 0]-self.log[k, 0])[..., None], 0.)
+        return J
+
+    def sample_jac(self, t, loc):
+        return self.jac_points(t, loc[0], loc[1])
+
+    def summarize(self):
+        self.log
+        return f'log {self.filename}: {self.n} samples over {self.t1-self.t0:.0f}s ' + (f'at {1/self.dt:.1f}Hz' if self.uniform else '(irregular)')
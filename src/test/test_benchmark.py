@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, tempfile
+
+import d2d.benchmark as dbench
+
+def test_bench_integrators():
+    res = dbench.bench_integrators(['line'], [0.1], ['euler', 'rk4'], [1, dbench.ref_substeps], verbose=False)
+    e = {(_e['integrator'], _e['substeps']):_e for _e in res['results']}
+    assert all([_e['status'] == 'ok' and _e['steps_per_s'] > 0 for _e in e.values()])
+    assert e[('rk4', dbench.ref_substeps)]['err_pos_max'] < 1e-9 # the reference itself
+    assert e[('rk4', 1)]['err_pos_max'] < e[('euler', 1)]['err_pos_max']
+    assert e[('euler', dbench.ref_substeps)]['err_pos_max'] < e[('euler', 1)]['err_pos_max']
+    with tempfile.TemporaryDirectory() as _dir:
+        dbench.save(os.path.join(_dir, 'bench.json'), res)
+        assert dbench.load(os.path.join(_dir, 'bench.json'))['results'][0]['integrator'] == 'euler'
+
+def test_bench_fleet():
+    trajs, aircrafts, windfield, X0s = dbench.synthetic_fleet(6)
+    assert X0s.shape == (6, 5) and len(trajs) == 6
+    res = dbench.bench_fleet_scaling([1, 3], ['dfff', 'pp'], n_ticks=5, verbose=False)
+    assert len(res['results']) == 4
+    for e in res['results']:
+        assert e['ctl_us_per_ac_tick'] > 0 and e['rtf'] > 0 and e['mem_peak_mb'] > 0
+    assert dbench.max_realtime_fleet(res, 'pp') in [0, 1, 3]
+
+
+def main():
+    test_bench_integrators()
+    test_bench_fleet()
+
+if __name__ == '__main__':
+    main()
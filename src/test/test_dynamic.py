@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+
+def random_fleet(n=4, seed=0):
+    rng = np.random.default_rng(seed)
+    acs = [ddyn.Aircraft() for i in range(n)]
+    for ac in acs:
+        ac.tau_phi, ac.tau_v = rng.uniform(0.1, 0.5), rng.uniform(0.5, 2.)
+    Xs = np.column_stack([rng.uniform(-50, 50, n), rng.uniform(-50, 50, n), rng.uniform(-np.pi, np.pi, n),
+                          rng.uniform(-0.5, 0.5, n), rng.uniform(9, 13, n)])
+    Us = np.column_stack([rng.uniform(-0.7, 0.7, n), rng.uniform(9, 15, n)])
+    return acs, Xs, Us
+
+def test_fleet_cont_dyn():
+    acs, Xs, Us = random_fleet()
+    W = ddg.WindField([1., -2.])
+    Xdots = ddyn.Fleet(acs).cont_dyn(Xs, 0., Us, W)
+    for ac, X, U, Xdot in zip(acs, Xs, Us, Xdots):
+        np.testing.assert_allclose(Xdot, ac.cont_dyn(X, 0., U, W))
+
+def test_fleet_disc_dyn():
+    acs, Xs, Us = random_fleet()
+    W = ddg.WindField([1., -2.])
+    fleet = ddyn.Fleet(acs)
+    Xs1, Xs2 = Xs.copy(), Xs.copy()
+    for k in range(100):
+        t = k*0.01
+        Xs1 = fleet.disc_dyn(Xs1, Us, W, t, 0.01)
+        Xs2 = np.array([ac.disc_dyn(X, U, W, t, 0.01) for ac, X, U in zip(acs, Xs2, Us)])
+    np.testing.assert_allclose(Xs1, Xs2, atol=1e-6)
+
+def test_fixed_step_integrators():
+    acs, Xs, Us = random_fleet(1)
+    ac, X0, U = acs[0], Xs[0], Us[0]
+    W = ddg.WindField([1., -2.])
+    Xref = ac.disc_dyn(X0, U, W, 0., 0.05)
+    for method, substeps, tol in [('euler', 10, 5e-2), ('heun', 1, 1e-2), ('rk4', 1, 1e-4), ('rk4', 5, 1e-6)]:
+        np.testing.assert_allclose(ac.disc_dyn(X0, U, W, 0., 0.05, method, substeps), Xref, atol=tol)
+    Xs1 = ddyn.Fleet(acs).disc_dyn(Xs, Us, W, 0., 0.05, 'rk4')
+    np.testing.assert_allclose(Xs1[0], ac.disc_dyn(X0, U, W, 0., 0.05, 'rk4'))
+
+def test_zoh_integrator():
+    import scipy.integrate
+    acs, Xs, Us = random_fleet(1)
+    ac, X0, U = acs[0], Xs[0], Us[0]
+    W = ddg.WindField([1., -2.])
+    Xf = scipy.integrate.odeint(ac.cont_dyn, X0, [0, 2.], args=(U, W), rtol=1e-12, atol=1e-12)[1]
+    for dt, tol in [(0.05, 1e-3), (0.2, 5e-2)]:
+        X = X0
+        for k in range(int(round(2./dt))):
+            X = ac.disc_dyn(X, U, W, k*dt, dt, 'zoh')
+        np.testing.assert_allclose(X[ddyn.Aircraft.s_phi:], Xf[ddyn.Aircraft.s_phi:], atol=1e-9)
+        np.testing.assert_allclose(X, Xf, atol=tol)
+
+def test_cont_jac_batch():
+    acs, Xs, Us = random_fleet(10)
+    Ws = np.zeros((len(Xs), 2))
+    A, B = acs[0].cont_jac_batch(Xs, Us, 0., Ws)
+    assert A.shape == (10, 5, 5) and B.shape == (10, 5, 2)
+    for X, U, _A, _B in zip(Xs, Us, A, B):
+        A1, B1 = acs[0].cont_jac(X, U, 0., None)
+        np.testing.assert_allclose(_A, A1); np.testing.assert_allclose(_B, B1)
+    A, B = ddyn.Fleet(acs).cont_jac(Xs, Us, 0., None)
+    for ac, X, U, _A, _B in zip(acs, Xs, Us, A, B):
+        A1, B1 = ac.cont_jac(X, U, 0., None)
+        np.testing.assert_allclose(_A, A1); np.testing.assert_allclose(_B, B1)
+
+
+def main():
+    test_fleet_cont_dyn()
+    test_fleet_disc_dyn()
+    test_fixed_step_integrators()
+    test_zoh_integrator()
+    test_cont_jac_batch()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import control
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.scenario as dds
+import d2d.simulation as dsim
+
+def test_gain_table():
+    # interpolated and rotated gains match the online solution, None outside the table
+    Q, R = [1., 1., 20.], [500, 2000]
+    table, ac = ddg.gain_table(Q, R), ddyn.Aircraft()
+    assert ddg.gain_table(Q, R) is table
+    rng = np.random.default_rng(0)
+    for k in range(50):
+        X = np.array([0., 0., rng.uniform(-np.pi, np.pi), rng.uniform(-0.9, 0.9), rng.uniform(7., 18.)])
+        A, B = ac.cont_jac(X, [0., 0.], 0., None)
+        K1 = control.lqr(A[:3, :3], A[:3, 3:], np.diag(Q), np.diag(R))[0]
+        np.testing.assert_allclose(table.get(X[4], X[3], X[2]), K1, atol=1e-3*np.max(np.abs(K1)))
+    assert table.get(25., 0., 0.) is None and table.get(12., 1.3, 0.) is None
+
+def test_scheduled_dfff():
+    scen, desc = dds.get('circle')
+    time = scen.time[:int(10./(scen.time[1]-scen.time[0]))]
+    ac, pert = scen.aircrafts[0], scen.perts.for_aircraft(0)
+    runs = []
+    for scheduled in [False, True]:
+        ctl = ddg.DFFFController(scen.trajs[0], ac, scen.windfield, record=False, scheduled=scheduled)
+        runs.append(dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], pert, 'rk4'))
+    assert ctl.n_fallback == 0
+    np.testing.assert_allclose(runs[1][0], runs[0][0], atol=1e-2)
+
+def test_tvlqr():
+    # the last gains are the steady state discrete lqr ones, tracking close to the online controller
+    scen, desc = dds.get('circle')
+    time = scen.time[:int(10./(scen.time[1]-scen.time[0]))]
+    ac, pert, traj = scen.aircrafts[0], scen.perts.for_aircraft(0), scen.trajs[0]
+    ctl = ddg.DFFFController(traj, ac, scen.windfield, record=True, tvlqr=True)
+    gains = ctl.tv_gains
+    assert gains.get(-1.) is None and gains.get(traj.duration+1.) is None
+    Xr, Ur, K = gains.get(gains.time[-1])
+    Ad, Bd = ddyn.Aircraft.cont_jac(ac, Xr, Ur, 0., None)
+    Ad, Bd = np.eye(3)+Ad[:3, :3]*gains.dt, gains.dt*Ad[:3, 3:]+gains.dt**2/2*Ad[:3, :3]@Ad[:3, 3:]
+    Kd = control.dlqr(Ad, Bd, np.diag(ctl.Q)*gains.dt, np.diag(ctl.R)*gains.dt)[0]
+    np.testing.assert_allclose(K[:, :3], Kd, atol=1e-3*np.max(np.abs(Kd)))
+    assert gains.get(gains.time[10]+gains.dt/2)[0] is None
+    X, U, Y = dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], pert, 'rk4')
+    ctl1 = ddg.DFFFController(traj, ac, scen.windfield, record=False)
+    X1, U1, Y1 = dsim.run_simulation(time, ac, scen.windfield, ctl1, scen.X0s[0], pert, 'rk4')
+    e, e1 = [np.mean(np.linalg.norm(_X[:, :2]-Y[:, 0], axis=1)) for _X in (X, X1)]
+    assert e < 1.2*e1+0.1
+
+def test_batched_flatness():
+    # one pass over a (time, fleet) grid of outputs matches the single point inverse, with per aircraft parameters
+    scen, desc = dds.get('patrol_3')
+    ts = scen.time[::50]
+    fleet = ddyn.Fleet(scen.aircrafts)
+    Ys = np.stack([traj.get_batch(ts) for traj in scen.trajs], axis=1) # (T, nv, nder+1, 2)
+    W = np.array([2., -1.])
+    Xr, Ur, Xrdot = ddg.DiffFlatness.state_and_input_from_outputs(Ys, W, fleet)
+    assert Xr.shape == Ys.shape[:2]+(ddyn.Aircraft.s_size,)
+    for k, t in enumerate(ts):
+        for i, (traj, ac) in enumerate(zip(scen.trajs, scen.aircrafts)):
+            _X, _U, _Xdot = ddg.DiffFlatness.state_and_input_from_output(traj.get(t), W, ac)
+            np.testing.assert_allclose(Xr[k, i], _X); np.testing.assert_allclose(Ur[k, i], _U)
+    Yr, Xr, Ur, Xrdot = ddg.DiffFlatness.reference(scen.trajs[0], ddg.WindField(W), scen.aircrafts[0], ts)
+    np.testing.assert_allclose(Yr, Ys[:, 0])
+
+def test_fleet_dfff():
+    # same closed loop as one DFFFController per aircraft, online and scheduled gains
+    scen, desc = dds.get('patrol_3')
+    time = scen.time[:int(10./(scen.time[1]-scen.time[0]))]
+    fleet = ddyn.Fleet(scen.aircrafts)
+    for scheduled in [False, True]:
+        ctls = [ddg.DFFFController(traj, ac, scen.windfield, record=False, scheduled=scheduled) for traj, ac in zip(scen.trajs, scen.aircrafts)]
+        Xs, Us, Yrefs = dsim.run_fleet_simulation(time, fleet, scen.windfield, ctls, scen.X0s, scen.perts, 'zoh')
+        ctl = ddg.FleetDFFFController(scen.trajs, scen.aircrafts, scen.windfield, record=True, scheduled=scheduled)
+        Xs1, Us1, Yrefs1 = dsim.run_fleet_simulation(time, fleet, scen.windfield, ctl, scen.X0s, scen.perts, 'zoh')
+        np.testing.assert_allclose(np.array(Us1), np.array(Us), atol=1e-6)
+        np.testing.assert_allclose(np.array(Yrefs1), np.array(Yrefs), atol=1e-9)
+        assert np.array(ctl.U).shape == (len(time), len(fleet), ddyn.Aircraft.i_size)
+        assert ctl.n_fallback == sum([_c.n_fallback for _c in ctls])
+
+
+def main():
+    test_gain_table()
+    test_scheduled_dfff()
+    test_tvlqr()
+    test_batched_flatness()
+    test_fleet_dfff()
+
+if __name__ == '__main__':
+    main()
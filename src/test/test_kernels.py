@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, tempfile
+import numpy as np
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.kernels as d2k
+import d2d.trajectory as ddt
+from test_dynamic import random_fleet
+
+def test_jacobian():
+    # generated jacobians match finite differences of the generated dynamics, batched and single point
+    acs, Xs, Us = random_fleet(8)
+    fleet, W, e = ddyn.Fleet(acs), np.array([1., -2.]), 1e-6
+    A, B = d2k.jac(Xs, Us, W, fleet.tau_phi, fleet.tau_v, fleet.g)
+    for i, dz in enumerate(np.eye(ddyn.Aircraft.s_size)):
+        num = (d2k.dyn(Xs+e*dz, Us, W, fleet.tau_phi, fleet.tau_v) - d2k.dyn(Xs-e*dz, Us, W, fleet.tau_phi, fleet.tau_v))/2/e
+        np.testing.assert_allclose(A[..., i], num, atol=1e-6)
+    for i, dz in enumerate(np.eye(ddyn.Aircraft.i_size)):
+        num = (d2k.dyn(Xs, Us+e*dz, W, fleet.tau_phi, fleet.tau_v) - d2k.dyn(Xs, Us-e*dz, W, fleet.tau_phi, fleet.tau_v))/2/e
+        np.testing.assert_allclose(B[..., i], num, atol=1e-6)
+    for ac, X, U, _A, _B in zip(acs, Xs, Us, A, B):
+        _A1, _B1 = ac.cont_jac(X, U, 0., ddg.WindField(W))
+        np.testing.assert_allclose(_A1, _A); np.testing.assert_allclose(_B1, _B)
+        np.testing.assert_allclose(ac.cont_dyn(X, 0., U, ddg.WindField(W)), d2k.dyn(X, U, W, ac.tau_phi, ac.tau_v))
+
+def test_flatness():
+    # the reference input drives the model along the reference state derivative
+    ac, W = ddyn.Aircraft(), np.array([2., 1.])
+    traj = ddt.TrajectoryCircle(c=[0, 0], r=40)
+    ts = np.arange(0., 10., 0.5)
+    Ys = np.array([traj.get(t) for t in ts])
+    X, U, Xdot = d2k.flatness(Ys, W, np.zeros(2), ac.tau_phi, ac.tau_v)
+    assert X.shape == (len(ts), ddyn.Aircraft.s_size) and U.shape == (len(ts), ddyn.Aircraft.i_size)
+    np.testing.assert_allclose(d2k.dyn(X, U, W, ac.tau_phi, ac.tau_v), Xdot, atol=1e-9)
+    for Y, _X, _U in zip(Ys, X, U):
+        Xr, Ur, Xrdot = ddg.DiffFlatness.state_and_input_from_output(Y, W, ac)
+        np.testing.assert_allclose(Xr, _X); np.testing.assert_allclose(Ur, _U)
+
+def test_cache():
+    with tempfile.TemporaryDirectory() as _dir:
+        k1 = d2k.load(_dir)
+        assert os.listdir(_dir) == [f'd2d_kernels_{d2k.key()}.py']
+        k2 = d2k.load(_dir) # from the cache
+        X, U = [0., 0., 0.3, 0.1, 12.], [0.2, 11.]
+        np.testing.assert_allclose(k1.dyn(X, U, [1., 0.], 0.1, 1., 9.81), k2.dyn1(X, U, [1., 0.], 0.1, 1., 9.81))
+
+
+def main():
+    test_jacobian()
+    test_flatness()
+    test_cache()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np, control
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.scenario as dds
+import d2d.simulation as dsim
+import d2d.montecarlo as dmc
+import d2d.wind as d2w
+
+def test_lqr_batch():
+    rng = np.random.default_rng(0)
+    Xr = np.zeros((50, ddyn.Aircraft.s_size))
+    Xr[:, 2:] = rng.uniform([-3, -0.5, 9], [3, 0.5, 15], size=(50, 3))
+    A, B = ddyn.cont_jacs(Xr, 1., 3.)
+    A, B = A[:, :3, :3], A[:, :3, 3:]
+    Q, R = [1., 1., 20.], [500, 2000]
+    K = ddg.lqr_batch(A, B, Q, R)
+    K1 = np.array([control.lqr(_A, _B, np.diag(Q), np.diag(R))[0] for _A, _B in zip(A, B)])
+    np.testing.assert_allclose(K, K1, atol=1e-9)
+    np.testing.assert_allclose(ddg.lqr_batch(A, B, Q, R, K0=K1+0.01*np.abs(K1)), K1, atol=1e-9) # warm start
+
+def test_montecarlo_matches_simulation():
+    scen, desc = dds.get('line')
+    mc = dmc.MonteCarlo(scen, 1, sig_X0=np.zeros(5), sig_w=0., n_perts=0)
+    res = mc.run('zoh', keep_history=True)
+    ac = scen.aircrafts[0]
+    ctl = ddg.DFFFController(scen.trajs[0], ac, scen.windfield, record=False)
+    X, U, Yref = dsim.run_simulation(scen.time, ac, scen.windfield, ctl, scen.X0s[0], scen.perts, 'zoh')
+    np.testing.assert_allclose(res.X[:, 0, 0], X, atol=1e-8)
+    np.testing.assert_allclose(res.err_final[0, 0], np.linalg.norm(X[-1, :2]-Yref[-1, 0]))
+
+def test_montecarlo_wind_fields():
+    # grid and dryden scenario fields keep their structure in every run
+    for name in ['circle_shear', 'circle_gust']:
+        scen, desc = dds.get(name)
+        scen.time = scen.time[:1000]
+        res = dmc.MonteCarlo(scen, 2, sig_X0=np.zeros(5), sig_w=0., n_perts=0).run('zoh', keep_history=True)
+        for j, (ac, traj) in enumerate(zip(scen.aircrafts, scen.trajs)):
+            ctl = ddg.DFFFController(traj, ac, scen.windfield, record=False)
+            X, U, Yref = dsim.run_simulation(scen.time, ac, d2w.for_aircraft(scen.windfield, j), ctl, scen.X0s[j],
+                                             scen.perts.for_aircraft(j), 'zoh')
+            np.testing.assert_allclose(res.X[:, 1, j], X, atol=1e-6)
+
+def test_montecarlo_reproducible():
+    scen, desc = dds.get('line')
+    scen.set_dt(0.05)
+    res1 = dmc.MonteCarlo(scen, 8, seed=1).run()
+    res2 = dmc.MonteCarlo(scen, 4, seed=1).run() # a run does not depend on the number of runs
+    np.testing.assert_allclose(res1.err_mean[:4], res2.err_mean)
+    assert np.all(res1.err_max >= res1.err_mean) and np.all(res1.sat_time >= 0)
+
+
+def main():
+    test_lqr_batch()
+    test_montecarlo_matches_simulation()
+    test_montecarlo_wind_fields()
+    test_montecarlo_reproducible()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, tempfile
+import numpy as np
+
+import d2d.sensors as dsens
+
+_telemetry_xml = '''<telemetry>
+  <process name="Ap">
+    <mode name="default">
+      <message name="ATTITUDE" period="0.2"/>
+      <message name="GPS" period="0.5"/>
+      <message name="ALIVE" period="5."/>
+    </mode>
+  </process>
+</telemetry>'''
+
+def test_telemetry_periods():
+    with tempfile.TemporaryDirectory() as _dir:
+        filename = os.path.join(_dir, 'telemetry.xml')
+        with open(filename, 'w') as f: f.write(_telemetry_xml)
+        assert dsens.telemetry_periods(filename) == {'GPS': 0.5, 'ATTITUDE': 0.2}
+    assert dsens.telemetry_periods() == dsens.default_periods
+
+def test_datalink():
+    n, dt = 50, 0.01
+    msgs = [dsens.gps_msg(0.25, 0., 0., 0.), dsens.attitude_msg(0.1, 0.)]
+    dl = dsens.Datalink(n, latency=(0.1, 0.), drop=0., msgs=msgs)
+    time = np.arange(0, 3, dt)
+    X = np.zeros((len(time), n, 5))
+    X[:, :, 0] = time[:, None]*10 + np.arange(n) # x moves at 10m/s
+    X[:, :, 4] = 10.
+    X[:, :, 3] = 0.1*time[:, None]
+    W = np.zeros((n, 2))
+    Xm = np.array([dl.step(t, _X, W) for t, _X in zip(time, X)])
+    # decoded positions are 0.1s old when they arrive, then held for a period
+    age = (X[:, :, 0] - Xm[:, :, 0])/10
+    assert np.all(age[-100:] >= 0.1-1e-6) and np.all(age[-100:] <= 0.35+1e-6)
+    assert np.all(np.abs(Xm[-100:, :, 3]-X[-100:, :, 3]) <= 0.1*0.2+1e-6)
+    np.testing.assert_allclose(Xm[-1, :, 4], 10.)
+    assert 11*n <= dl.msgs[0].sent <= 12*n # every aircraft sends every period, with random phases
+    dl = dsens.Datalink(n, drop=1.)
+    Xm = np.array([dl.step(t, _X, W) for t, _X in zip(time, X)])
+    np.testing.assert_array_equal(Xm[-1], X[0]) # nothing ever arrives
+    assert dl.msgs[1].dropped == dl.msgs[1].sent
+
+
+def main():
+    test_telemetry_periods()
+    test_datalink()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, tempfile
+import numpy as np
+
+import d2d.trajectory as ddt
+import d2d.scenario as dds
+import d2d.simulation as dsim
+import d2d.sim_cache as dsc
+
+def test_sim_cache():
+    scen, desc = dds.get('patrol')
+    scen.set_dt(0.05)
+    with tempfile.TemporaryDirectory() as _dir:
+        cache = dsc.SimCache(_dir)
+        Xs1, Us1, Yrefs1 = cache.simulate_scenario(scen, dsim.make_controllers(scen), 'zoh')
+        assert (cache.hits, cache.misses) == (0, 2)
+        ctls = dsim.make_controllers(scen)
+        Xs2, Us2, Yrefs2 = cache.simulate_scenario(scen, ctls, 'zoh')
+        assert (cache.hits, cache.misses) == (2, 2)
+        for X1, X2 in zip(Xs1, Xs2): np.testing.assert_array_equal(X1, X2)
+        assert len(ctls[0].Xref) == len(scen.time) # controller records are restored
+        scen.X0s[1] = np.array(scen.X0s[1]) + [1., 0, 0, 0, 0] # only the second aircraft changed
+        cache.simulate_scenario(scen, dsim.make_controllers(scen), 'zoh')
+        assert (cache.hits, cache.misses) == (3, 3)
+        ctls = dsim.make_controllers(scen)
+        ctls[0].Q = [1., 1., 10.] # so did the first controller gains
+        cache.simulate_scenario(scen, ctls, 'zoh')
+        assert (cache.hits, cache.misses) == (4, 4) and len(cache.entries()) == 4
+        cache.max_bytes = cache.size() - 1 # the least recently used entry goes away
+        oldest = cache.entries()[0][2]
+        cache.evict()
+        assert len(cache.entries()) == 3 and not os.path.exists(oldest)
+
+def test_fingerprint():
+    # functions are told apart by their code and captured values, not their names
+    def make(k): return lambda x: k*x
+    f1, f2, f3 = (lambda x: 2*x), (lambda x: 3*x), (lambda x: 2*x)
+    assert dsc.fingerprint(f1) != dsc.fingerprint(f2) and dsc.fingerprint(f1) == dsc.fingerprint(f3)
+    assert dsc.fingerprint(make(1.)) != dsc.fingerprint(make(2.)) and dsc.fingerprint(make(1.)) == dsc.fingerprint(make(1.))
+    assert dsc.fingerprint(np.sin) != dsc.fingerprint(np.cos)
+    assert len(dsc.code_key()) == 64
+
+def test_code_change():
+    # changing the trajectory code (here a method of a parent class) invalidates the entries
+    scen, desc = dds.get('patrol')
+    scen.set_dt(0.05)
+    with tempfile.TemporaryDirectory() as _dir:
+        cache = dsc.SimCache(_dir)
+        cache.simulate_scenario(scen, dsim.make_controllers(scen), 'zoh')
+        _get = ddt.CompositeTraj.get
+        ddt.CompositeTraj.get = lambda self, t: _get(self, t)
+        try: cache.simulate_scenario(scen, dsim.make_controllers(scen), 'zoh')
+        finally: ddt.CompositeTraj.get = _get
+        assert (cache.hits, cache.misses) == (0, 4)
+        cache.simulate_scenario(scen, dsim.make_controllers(scen), 'zoh')
+        assert (cache.hits, cache.misses) == (2, 4)
+    assert 'd2d.trajectory_factory' in dsc.code_modules and 'd2d.scenario' in dsc.code_modules
+
+
+def main():
+    test_sim_cache()
+    test_fingerprint()
+    test_code_change()
+
+if __name__ == '__main__':
+    main()
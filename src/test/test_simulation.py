@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, tempfile
+import numpy as np
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.scenario as dds
+import d2d.simulation as dsim
+import d2d.recorder as d2rec
+
+def line_scenario(duration=7.):
+    scen, desc = dds.get('line')
+    n = int(round(duration/(scen.time[1]-scen.time[0])))
+    return scen, scen.time[:n], scen.perts
+
+def test_adaptive_simulation():
+    scen, time, perts = line_scenario()
+    ac = ddyn.Aircraft()
+    ctl = ddg.DFFFController(scen.trajs[0], ac, scen.windfield, record=False)
+    X1, U1, Yref1 = dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], perts)
+    X2, U2, Yref2 = dsim.run_simulation_adaptive(time, ac, scen.windfield, ctl, scen.X0s[0], perts, ctl_dt=0.01,
+                                                 rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(X1, X2, atol=1e-4)
+    np.testing.assert_allclose(U1, U2, atol=1e-4)
+    X3, U3, Yref3 = dsim.run_simulation_adaptive(time, ac, scen.windfield, ctl, scen.X0s[0], perts, ctl_dt=0.1)
+    t, X4, U4, Yref4 = dsim.run_simulation_adaptive(time, ac, scen.windfield, ctl, scen.X0s[0], perts, ctl_dt=0.1, dense=False)
+    assert len(t) < len(time)/2
+    np.testing.assert_allclose(X4[-1], X3[-1], atol=1e-6)
+
+def test_streamed_simulation():
+    scen, time, perts = line_scenario()
+    ac = ddyn.Aircraft()
+    ctl = ddg.DFFFController(scen.trajs[0], ac, scen.windfield, record=False)
+    X1, U1, Yref1 = dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], perts, 'rk4')
+    with tempfile.TemporaryDirectory() as _dir:
+        with d2rec.ChunkedWriter(_dir, chunk_size=100) as writer:
+            dsim.run_simulation_streamed(time, ac, scen.windfield, ctl, scen.X0s[0], perts, writer, 'rk4')
+        run = d2rec.load(_dir)
+        assert isinstance(run['X'], np.memmap) and run['K'].shape == (len(time), 2, 5)
+        np.testing.assert_allclose(run['t'], time)
+        np.testing.assert_allclose(run['X'], X1)
+        np.testing.assert_allclose(run['U'], U1)
+        np.testing.assert_allclose(run['Yref'], Yref1)
+        del run
+    ctl = ddg.PurePursuitControler(scen.trajs[0], record=False)
+    dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], perts, 'zoh')
+    assert len(ctl.carrot) == 0 and len(ctl.ref_pos) == 0 # constant memory without records
+
+def test_multirate_simulation():
+    scen, time, perts = line_scenario()
+    ac = ddyn.Aircraft()
+    ctl = ddg.DFFFController(scen.trajs[0], ac, scen.windfield, record=False)
+    X1, U1, Yref1 = dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], perts, 'rk4')
+    X2, U2, Yref2 = dsim.run_multirate_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], perts, ctl_period=0.01,
+                                                  integrator='rk4')
+    np.testing.assert_allclose(X1, X2)
+    tel, sched = dsim.Telemetry(), dsim.Scheduler()
+    sched.add('telemetry', 0.25, tel, phase=0.1)
+    X3, U3, Yref3 = dsim.run_multirate_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], perts, ctl_period=0.1,
+                                                  sched=sched, integrator='rk4')
+    assert [_t.count for _t in sched.tasks] == [70, 28]
+    np.testing.assert_allclose(tel.t[:2], [0.1, 0.35])
+    assert np.all(U3[1:10] == U3[0]) and np.any(U3[10] != U3[9]) # zero order hold
+    assert np.mean(np.linalg.norm(X3[:,:2]-Yref3[:,0], axis=1)) < 1.05*np.mean(np.linalg.norm(X1[:,:2]-Yref1[:,0], axis=1))
+
+def test_pert_schedule():
+    scen, time, perts = line_scenario()
+    assert len(perts) == 1
+    dense = np.zeros((len(time), ddyn.Aircraft.s_size))
+    dense[600, ddyn.Aircraft.s_y] = 10
+    ac = ddyn.Aircraft()
+    ctl = ddg.DFFFController(scen.trajs[0], ac, scen.windfield, record=False)
+    X1, U1, Yref1 = dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], dense, 'rk4')
+    X2, U2, Yref2 = dsim.run_simulation(time, ac, scen.windfield, ctl, scen.X0s[0], perts, 'rk4')
+    np.testing.assert_array_equal(X1, X2)
+    assert X2[600, ddyn.Aircraft.s_y] - X2[599, ddyn.Aircraft.s_y] > 9.
+    sched = dsim.PertSchedule([(2., 1, {ddyn.Aircraft.s_x: 1.}), (1., 0, np.ones(5)), (0., 0, np.ones(5))])
+    np.testing.assert_allclose(sched.times(), [0., 1., 2.])
+    assert [len(_s) for _s in sched.split(3)] == [2, 1, 0]
+    cursor = sched.cursor(0.) # events at t0 are not applied
+    assert cursor.pop(0.5) == [] and len(cursor.pop(1.)) == 1
+    (ac, dX), = cursor.pop(10.)
+    assert ac == 1 and dX[ddyn.Aircraft.s_x] == 1.
+
+def test_checkpoint_resume():
+    scen, desc = dds.get('patrol')
+    time = scen.time[:1000]
+    for ctl_cls in [lambda: ddg.DFFFController(scen.trajs[0], scen.aircrafts[0], scen.windfield),
+                    lambda: ddg.PurePursuitControler(scen.trajs[0])]:
+        ctl = ctl_cls(); ctl.control_vel = True
+        X1, U1, Yref1 = dsim.run_simulation(time, scen.aircrafts[0], scen.windfield, ctl, scen.X0s[0], None, 'rk4')
+        ctl = ctl_cls(); ctl.control_vel = True
+        X2, U2, Yref2, ckpts = dsim.run_simulation_checkpointed(time, scen.aircrafts[0], scen.windfield, ctl, scen.X0s[0], None,
+                                                                2., 'rk4')
+        np.testing.assert_array_equal(X1, X2); np.testing.assert_array_equal(U1, U2)
+        assert [_c.i for _c in ckpts] == [0, 200, 400, 600, 800]
+        with tempfile.TemporaryDirectory() as _dir:
+            dsim.save_checkpoints(os.path.join(_dir, 'ckpts.pkl'), ckpts)
+            ckpts = dsim.load_checkpoints(os.path.join(_dir, 'ckpts.pkl'))
+        ckpt = dsim.find_checkpoint(ckpts, 5.)
+        assert ckpt.i == 400
+        X3, U3, Yref3, _ = dsim.run_simulation_checkpointed(time, scen.aircrafts[0], scen.windfield, ctl, None, None, 2., 'rk4',
+                                                            resume=ckpt)
+        np.testing.assert_array_equal(X1, X3); np.testing.assert_array_equal(U1, U3)
+        assert len(ctl.U) == len(time) # records are rolled back, then continued
+        perts = dsim.PertSchedule([(3., 0, {ddyn.Aircraft.s_x: 5.}), (6., 0, {ddyn.Aircraft.s_x: 5.})])
+        ctl = ctl_cls(); ctl.control_vel = True
+        X4, U4, Yref4, _ = dsim.run_simulation_checkpointed(time, scen.aircrafts[0], scen.windfield, ctl, None, perts,
+                                                            2., 'rk4', resume=ckpt)
+        np.testing.assert_array_equal(X4[:600], X1[:600]) # the perturbation before the checkpoint is history
+        assert X4[600, 0] - X1[600, 0] > 4.
+
+def test_ring_recorder():
+    # bounded zero copy views of the last rows, the spilled files hold the whole history
+    with tempfile.TemporaryDirectory() as _dir:
+        rec = d2rec.RingRecorder(depth=8, dtype=np.float32, spill=_dir, chunk=4)
+        for i in range(21): rec.append(t=0.1*i, X=np.full(3, i), p=np.array([i+1j, -i]))
+        assert len(rec) == 8 and rec['X'].dtype == np.float32 and rec['t'].dtype == np.float64 and rec['p'].dtype == np.complex64
+        np.testing.assert_array_equal(rec['X'][:, 0], np.arange(13, 21))
+        np.testing.assert_array_equal(rec.view('p', 3)[:, 0], np.arange(18, 21)+1j)
+        assert np.shares_memory(rec['X'], rec._bufs['X'])
+        try: rec.truncate(15); assert False # already spilled
+        except ValueError: pass
+        rec.truncate(18)
+        np.testing.assert_array_equal(rec['X'][-1], np.full(3, 17))
+        rec.append(t=1.5, X=np.full(3, 99), p=np.zeros(2))
+        rec.close()
+        run = d2rec.load(_dir)
+        np.testing.assert_array_equal(run['X'][:, 0], list(range(18))+[99])
+        np.testing.assert_allclose(run['t'], list(0.1*np.arange(18))+[1.5])
+    # controllers record the same as in their lists, a checkpoint resume rolls the recorder back
+    scen, desc = dds.get('circle')
+    time = scen.time[:1000]
+    X1, U1, Yref1 = dsim.run_simulation(time, scen.aircrafts[0], scen.windfield, ddg.DFFFController(scen.trajs[0], scen.aircrafts[0], scen.windfield),
+                                        scen.X0s[0], None, 'rk4')
+    rec = d2rec.RingRecorder(depth=256)
+    ctl = ddg.DFFFController(scen.trajs[0], scen.aircrafts[0], scen.windfield, record=rec)
+    X2, U2, Yref2, ckpts = dsim.run_simulation_checkpointed(time, scen.aircrafts[0], scen.windfield, ctl, scen.X0s[0], None, 1., 'rk4')
+    np.testing.assert_array_equal(U1, U2)
+    np.testing.assert_array_equal(ctl.records('U'), U1[-256:]); assert ctl.records('fb_poles').shape == (256, 5)
+    dsim.run_simulation_checkpointed(time, scen.aircrafts[0], scen.windfield, ctl, None, None, 1., 'rk4', resume=dsim.find_checkpoint(ckpts, 9.5))
+    assert rec.n == len(time)
+    np.testing.assert_array_equal(ctl.records('U'), U1[-256:])
+
+def run_script(**kwargs):
+    # 05_test_simulation.py with chrono plots, headless
+    import runpy, matplotlib; matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    script = runpy.run_path(os.path.join(os.path.dirname(__file__), '..', '05_test_simulation.py'))
+    scen, desc = dds.get('line')
+    script['test_simulation'](scen, True, False, False, False, None, integrator='zoh', **kwargs)
+    plt.close('all')
+
+def test_adaptive_script():
+    run_script(adaptive=True, ctl_dt=0.1)
+
+def test_multirate_script():
+    run_script(multirate=True, ctl_dt=0.1)
+    time, ts = np.arange(0., 1., 0.01), np.arange(0., 1., 0.1)
+    np.testing.assert_array_equal(dsim.hold_records(ts, np.arange(10), time), np.repeat(np.arange(10), 10))
+
+
+def main():
+    test_adaptive_simulation()
+    test_streamed_simulation()
+    test_multirate_simulation()
+    test_pert_schedule()
+    test_checkpoint_resume()
+    test_ring_recorder()
+    test_adaptive_script()
+    test_multirate_script()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, signal, tempfile
+import numpy as np
+
+import d2d.sweep as dsw
+
+def test_sweep():
+    jobs = dsw.make_jobs(['line', 'no_such_scenario'], winds=[None, [1., 0.]], dts=[0.05], integrator='zoh')
+    assert len(jobs) == 4
+    results = dsw.run_sweep(jobs, n_workers=2, timeout=60., keep_states=True, verbose=False)
+    assert [res['status'] for res in results] == ['ok', 'ok', 'failed', 'failed'] # a failing job does not stop the sweep
+    assert 'KeyError' in results[2]['error']
+    assert results[0]['X'][0].shape == (240, 5) and results[0]['metrics'][0]['err_max'] > 9. # y perturbation
+    with tempfile.TemporaryDirectory() as _dir:
+        dsw.save(os.path.join(_dir, 'sweep'), results)
+        assert dsw.load(os.path.join(_dir, 'sweep'))[1]['job']['wind'] == [1., 0.]
+        assert len(np.load(os.path.join(_dir, 'sweep.npz')).files) == 2
+
+def _crashing_run_job(job, timeout=None):
+    if job['scen'] == 'circle': os._exit(1) # the worker dies
+    return _run_job(job, timeout)
+_run_job = dsw.run_job
+
+def test_worker_crash():
+    # only the job whose worker died fails, the others are rerun
+    jobs = dsw.make_jobs(['line', 'circle'], winds=[None, [1., 0.], [2., 0.]], dts=[0.1], integrator='zoh')
+    dsw.run_job = _crashing_run_job
+    try: results = dsw.run_sweep(jobs, n_workers=2, verbose=False)
+    finally: dsw.run_job = _run_job
+    assert [res['status'] for res in results] == ['ok']*3+['failed']*3
+    assert 'BrokenProcessPool' in results[3]['error']
+
+def test_job_timeout():
+    handler = signal.getsignal(signal.SIGALRM)
+    res = dsw.run_job(dsw.make_jobs(['circle'])[0], timeout=0.2)
+    assert res['status'] == 'timeout' and res['elapsed'] < 1.
+    assert signal.getsignal(signal.SIGALRM) == handler
+
+
+def main():
+    test_sweep()
+    test_worker_crash()
+    test_job_timeout()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+import d2d.trajectory as ddt
+import d2d.trajectory_factory as ddtf
+
+def test_get_batch():
+    # vectorized references match the sample by sample ones, including negative times and wrapped composites
+    trajs = [ddt.TrajectoryLine([0, 0], [100, 50], v=12., t0=1.),
+             ddt.TrajectoryCircle(c=[10, -5], r=-40, v=11., alpha0=0.3),
+             ddtf.get('square')[0], ddtf.get('line_with_intro')[0], ddtf.get('demo_minsnap')[0]]
+    for traj in trajs:
+        ts = np.arange(-1., 2*traj.duration, 0.05)
+        Ys = traj.get_batch(ts)
+        assert Ys.shape == (len(ts), ddt.Trajectory.nder+1, ddt.Trajectory.ncomp)
+        np.testing.assert_allclose(Ys, np.array([traj.get(t) for t in ts]), atol=1e-9)
+
+
+def main():
+    test_get_batch()
+
+if __name__ == '__main__':
+    main()
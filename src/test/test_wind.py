@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os, pickle, tempfile
+import numpy as np
+
+import d2d.dynamic as ddyn
+import d2d.guidance as ddg
+import d2d.trajectory as ddt
+import d2d.wind as d2w
+
+def test_dryden_field():
+    time = np.arange(0, 100, 0.05)
+    field = d2w.DrydenField(time, 200, mean=[0., 3.], sigma=2., L=60., V=12.)
+    assert field.gusts.shape == (200, len(time), 2) and field.gusts.dtype == np.float32
+    np.testing.assert_allclose(np.std(field.gusts, axis=(0, 1)), [2., 2.], rtol=0.05)
+    k = int(60./12./0.05) # longitudinal (here along y) correlation at one time constant
+    g = field.gusts[..., 1].astype(float)
+    np.testing.assert_allclose(np.mean(g[:, :-k]*g[:, k:])/np.var(g), np.exp(-1), atol=0.05)
+    # sampling interpolates the series, the mean is returned without aircraft
+    np.testing.assert_allclose(field.sample_batch(1.025, np.zeros((200, 2))),
+                               [0., 3.] + 0.5*(field.gusts[:, 20]+field.gusts[:, 21]), atol=1e-6)
+    np.testing.assert_allclose(field.sample(1., [0, 0]), [0., 3.])
+    np.testing.assert_allclose(field.for_aircraft(7).sample(1., [0, 0]), [0., 3.] + field.gusts[7, 20], rtol=1e-6)
+    assert d2w.for_aircraft(ddg.WindField([1., 0.]), 7).w == [1., 0.]
+
+def test_dryden_seeds():
+    time = np.arange(0, 10, 0.01)
+    f1 = d2w.DrydenField(time, 3, seeds=[1, 2, 3])
+    f2 = d2w.DrydenField(time, 2, seeds=[1, 2])
+    np.testing.assert_array_equal(f1.gusts[:2], f2.gusts) # series only depend on their own seed
+
+def random_grid(seed=0):
+    xs, ys, ts = np.linspace(0, 100, 11), np.linspace(-50, 50, 21), np.linspace(0, 60, 7)
+    return d2w.GridWindField(xs, ys, np.random.default_rng(seed).normal(size=(7, 11, 21, 2)), ts)
+
+def test_grid_field():
+    field = random_grid()
+    np.testing.assert_allclose(field.sample(10., [20., -10.]), field.W[1, 2, 8])
+    np.testing.assert_allclose(field.sample(15., [25., -10.]), 0.25*(field.W[1, 2, 8]+field.W[1, 3, 8]+field.W[2, 2, 8]+field.W[2, 3, 8]))
+    np.testing.assert_allclose(field.sample(-5., [-20., 80.]), field.W[0, 0, -1]) # border values are held
+    rng = np.random.default_rng(1)
+    P, ts = rng.uniform([0, -50], [100, 50], size=(100, 2)), rng.uniform(0, 60, 100)
+    Ws, Js = field.sample_points(ts, P[:, 0], P[:, 1]), field.jac_points(ts, P[:, 0], P[:, 1])
+    assert Ws.shape == (100, 2) and Js.shape == (100, 2, 3)
+    np.testing.assert_allclose(Ws[3], field.sample(ts[3], P[3]))
+    e = 1e-6
+    for k, dq in enumerate([[e, 0, 0], [0, e, 0], [0, 0, e]]):
+        num = (field.sample_points(ts+dq[2], P[:, 0]+dq[0], P[:, 1]+dq[1]) -
+               field.sample_points(ts-dq[2], P[:, 0]-dq[0], P[:, 1]-dq[1]))/2/e
+        np.testing.assert_allclose(Js[..., k], num, atol=1e-6)
+
+def test_flatness_wind_gradient():
+    # the reference state rates match the derivatives of the reference states in a non uniform wind
+    field, ac = random_grid(), ddyn.Aircraft()
+    traj = ddt.TrajectoryCircle(c=[50, 0], r=30)
+    ts, dt = np.arange(1., 10., 0.01), 1e-5
+    for t in ts[::50]:
+        Yr = traj.get(t)
+        W, Wdot = field.sample(t, Yr[0]), ddg.wind_rate(field, t, Yr[0], Yr[1])
+        X, U, Xdot = ddg.DiffFlatness.state_and_input_from_output(Yr, W, ac, Wdot)
+        X1 = ddg.DiffFlatness.state_and_input_from_output(traj.get(t+dt), field.sample(t+dt, traj.get(t+dt)[0]), ac)[0]
+        X0 = ddg.DiffFlatness.state_and_input_from_output(traj.get(t-dt), field.sample(t-dt, traj.get(t-dt)[0]), ac)[0]
+        num = (X1-X0)/2/dt
+        np.testing.assert_allclose(Xdot[[ddyn.Aircraft.s_psi, ddyn.Aircraft.s_va]],
+                                   num[[ddyn.Aircraft.s_psi, ddyn.Aircraft.s_va]], atol=1e-4)
+
+def test_wind_rates():
+    # batched wind rates along outputs match the per point ones
+    field, rng = random_grid(), np.random.default_rng(5)
+    Ys, ts = rng.normal(size=(30, 4, 2))*[[30, 20], [5, 5], [1, 1], [1, 1]]+[[50, 0], [0, 0], [0, 0], [0, 0]], rng.uniform(0, 60, 30)
+    Wdot = ddg.wind_rates(field, ts, Ys)
+    np.testing.assert_allclose(Wdot, [ddg.wind_rate(field, _t, Y[0], Y[1]) for _t, Y in zip(ts, Ys)])
+    np.testing.assert_allclose(ddg.wind_rates(field, ts[0], Ys)[3], ddg.wind_rate(field, ts[0], Ys[3, 0], Ys[3, 1]))
+    assert np.all(ddg.wind_rates(ddg.WindField([1., 2.]), ts[0], Ys) == 0)
+
+def test_batched_sample():
+    # sample(ts, xs, ys) matches the legacy per point sample(t, loc) on every source
+    time = np.arange(0, 60, 0.05)
+    rng = np.random.default_rng(2)
+    P, ts = rng.uniform([0, -50], [100, 50], size=(20, 2)), rng.uniform(0, 59, 20)
+    for field in [ddg.WindField([1., -2.]), random_grid(), d2w.for_aircraft(d2w.DrydenField(time, 3, mean=[2., 0.]), 1)]:
+        Ws = field.sample(ts, P[:, 0], P[:, 1])
+        assert Ws.shape == (20, 2)
+        np.testing.assert_allclose(Ws, [field.sample(_t, _p) for _t, _p in zip(ts, P)], atol=1e-6)
+        if not isinstance(field, d2w.DrydenField): # dryden batches are one row per aircraft
+            np.testing.assert_allclose(field.sample_batch(ts[0], P)[3], field.sample(ts[0], P[3]))
+        try: field.sample(ts[0], P); assert False # (N,2) locations are not a legacy (t, loc) call
+        except ValueError: pass
+
+def test_logged_field():
+    # memory mapped wind logs match a plain interpolation of the log, on regular and irregular timestamps
+    rng = np.random.default_rng(3)
+    with tempfile.TemporaryDirectory() as _dir:
+        for ts in [np.arange(0., 600., 0.1), np.cumsum(rng.uniform(0.05, 0.5, 2000))]:
+            W = np.column_stack((3*np.sin(ts/20), np.cos(ts/7)))
+            filename = os.path.join(_dir, 'wind.npy')
+            d2w.save_wind_log(filename, ts, W)
+            field = d2w.LoggedWindField(filename, offset=10.)
+            assert field._log is None # nothing read before the first sample
+            tq = rng.uniform(ts[0]-20, ts[-1], 500)
+            Ws = field.sample(tq, np.zeros(500), np.zeros(500))
+            assert isinstance(field.log, np.memmap) and field.uniform == (len(ts) == 6000)
+            _t = np.clip(tq+10., ts[0], ts[-1])
+            np.testing.assert_allclose(Ws, np.column_stack([np.interp(_t, ts, W[:, 0]), np.interp(_t, ts, W[:, 1])]), atol=1e-9)
+            np.testing.assert_allclose(field.sample(tq[5], [100., 20.]), Ws[5])
+            k = len(ts)//2
+            np.testing.assert_allclose(field.sample_jac((ts[k]+ts[k+1])/2-10., [0., 0.])[:, 2], (W[k+1]-W[k])/(ts[k+1]-ts[k]))
+            Ys = np.random.default_rng(4).normal(size=(50, 4, 2)) # batched rates match the per point ones, in and out of the log
+            _tq = np.linspace(ts[0]-20, ts[-1]+10, 50)
+            np.testing.assert_allclose(ddg.wind_rates(field, _tq, Ys), [ddg.wind_rate(field, _t, Y[0], Y[1]) for _t, Y in zip(_tq, Ys)])
+            field2 = pickle.loads(pickle.dumps(field)) # eg sent to sweep workers, reopens the file
+            assert field2._log is None
+            np.testing.assert_allclose(field2.sample(tq, 0., 0.), Ws)
+            del field, field2
+
+
+def main():
+    test_dryden_field()
+    test_dryden_seeds()
+    test_grid_field()
+    test_flatness_wind_gradient()
+    test_wind_rates()
+    test_batched_sample()
+    test_logged_field()
+
+if __name__ == '__main__':
+    main()